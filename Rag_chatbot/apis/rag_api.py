@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+RAG API - HTTP query service for the RAG knowledge base
+Keeps one RAGSystem loaded and serves /ask, /ask/stream, /search and /ingest
+"""
+
+from fastapi import FastAPI, HTTPException, UploadFile, File, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from typing import List, Dict, Any, Optional
+from collections import deque, defaultdict
+from contextlib import asynccontextmanager
+import uvicorn
+import asyncio
+import json
+import time
+import shutil
+import tempfile
+import sys
+import os
+
+# rag_pdf lives one level up; documents/, the cache databases and the log are resolved from there
+# as well, whatever directory the service is launched from
+RAG_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAG_ROOT)
+os.environ.setdefault("RAG_DATA_DIR", RAG_ROOT)
+from rag_pdf import RAGSystem, KNOWLEDGE_BASE_DIR, SUPPORTED_DOC_TYPES, get_doc_type
+
+SEARCH_BATCH_MAX = 32  # /search requests answered by one embedding round and FAISS call
+SEARCH_BATCH_WAIT = 0.005  # Seconds to wait for more requests before running a batch
+LATENCY_WINDOW = 1000  # Recent requests per endpoint kept for latency percentiles
+RETRIEVAL_MODES = ("vector", "hybrid", "lexical")
+
+
+class LatencyTracker:
+    """Per-endpoint request counts, latency percentiles and throughput over a recent window"""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self.counts = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.samples = defaultdict(lambda: deque(maxlen=self.window))  # (finished_at, seconds)
+
+    def record(self, endpoint: str, seconds: float, error: bool = False):
+        self.counts[endpoint] += 1
+        if error:
+            self.errors[endpoint] += 1
+        self.samples[endpoint].append((time.time(), seconds))
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        stats = {}
+        for endpoint, samples in self.samples.items():
+            latencies = sorted(seconds for _, seconds in samples)
+            elapsed = samples[-1][0] - samples[0][0] if len(samples) > 1 else 0.0
+            stats[endpoint] = {
+                "requests": self.counts[endpoint],
+                "errors": self.errors[endpoint],
+                "mean_ms": 1000 * sum(latencies) / len(latencies),
+                "p50_ms": 1000 * latencies[len(latencies) // 2],
+                "p95_ms": 1000 * latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+                "max_ms": 1000 * latencies[-1],
+                "requests_per_sec": (len(samples) - 1) / elapsed if elapsed else 0.0
+            }
+        return stats
+
+
+class SearchBatcher:
+    """Collects concurrent /search requests into micro-batches for KnowledgeBaseManager.search_batch
+
+    Requests that arrive while a batch is running, or within SEARCH_BATCH_WAIT of the first
+    one, share a single query-embedding round and a single FAISS search.
+    """
+
+    def __init__(self, rag: RAGSystem, max_batch: int = SEARCH_BATCH_MAX, max_wait: float = SEARCH_BATCH_WAIT):
+        self.rag = rag
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self.batches = 0
+        self.requests = 0
+        self.largest_batch = 0
+        self._queue = None
+        self._task = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def search(self, question: str, k: int, mode: Optional[str]) -> List[Dict]:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((question, k, mode, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Requests with different k or retrieval mode cannot share a FAISS call
+            groups = defaultdict(list)
+            for question, k, mode, future in batch:
+                groups[(k, mode)].append((question, future))
+            for (k, mode), requests in groups.items():
+                try:
+                    results = await asyncio.to_thread(
+                        self.rag.kb_manager.search_batch, [question for question, _ in requests], k, mode
+                    )
+                    for (_, future), result in zip(requests, results):
+                        if not future.done():
+                            future.set_result(result)
+                except Exception as e:
+                    for _, future in requests:
+                        if not future.done():
+                            future.set_exception(e)
+
+            self.batches += 1
+            self.requests += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "avg_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000
+        }
+
+
+rag: Optional[RAGSystem] = None
+search_batcher: Optional[SearchBatcher] = None
+latency = LatencyTracker()
+upload_lock = asyncio.Lock()  # Serializes the name check and rename of uploads
+
+
+def save_upload(source, file_path: str):
+    """Stream an upload to a temporary file in the knowledge base folder, then rename it into place
+
+    The temporary name matches no supported extension, so scans never pick up a partial upload.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), prefix=".upload-", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            shutil.copyfileobj(source, f)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load the knowledge base once for the lifetime of the service"""
+    global rag, search_batcher
+    rag = await asyncio.to_thread(RAGSystem)
+    search_batcher = SearchBatcher(rag)
+    search_batcher.start()
+    yield
+    await search_batcher.stop()
+    rag.async_pipeline.close()
+
+
+app = FastAPI(
+    title="🧠 RAG API",
+    description="Question answering and search over the RAG knowledge base",
+    version="1.0.0",
+    lifespan=lifespan
+)
+
+
+class AskQuery(BaseModel):
+    question: str
+    use_cache: bool = True
+    k: int = 3
+    mode: Optional[str] = None
+
+class AskResponse(BaseModel):
+    question: str
+    answer: str
+    cached: bool
+    source_files: List[str]
+    execution_time: float
+    time_to_first_token: Optional[float] = None
+    coalesced: bool = False
+    success: bool
+
+class SearchQuery(BaseModel):
+    question: str
+    k: int = 3
+    mode: Optional[str] = None
+
+class SearchResult(BaseModel):
+    content: str
+    metadata: Dict[str, Any]
+
+class SearchResponse(BaseModel):
+    question: str
+    results: List[SearchResult]
+    execution_time: float
+
+class IngestResponse(BaseModel):
+    filename: str
+    success: bool
+    chunks: int
+    total_documents: int
+
+
+def validate_query(question: str, k: int, mode: Optional[str]):
+    if not question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+    if k < 1:
+        raise HTTPException(status_code=400, detail="k must be at least 1")
+    if mode is not None and mode not in RETRIEVAL_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(RETRIEVAL_MODES)}")
+
+
+@app.middleware("http")
+async def measure_latency(request: Request, call_next):
+    """Record latency per endpoint (for /ask/stream: until the response starts)"""
+    start_time = time.perf_counter()
+    response = await call_next(request)
+    latency.record(request.url.path, time.perf_counter() - start_time, response.status_code >= 400)
+    return response
+
+
+@app.get("/")
+async def root():
+    return {
+        "message": "🧠 RAG API",
+        "status": "running",
+        "documents": len(rag.kb_manager.documents) if rag else 0,
+        "endpoints": ["/ask", "/ask/stream", "/search", "/ingest", "/ingest/scan", "/stats"]
+    }
+
+@app.post("/ask", response_model=AskResponse)
+async def ask(query: AskQuery):
+    """Answer a question; identical concurrent questions share one generation"""
+    validate_query(query.question, query.k, query.mode)
+    result = await rag.async_pipeline.ask(query.question, use_cache=query.use_cache, k=query.k, mode=query.mode)
+    if 'error' in result:
+        raise HTTPException(status_code=500, detail=result['error'])
+    return AskResponse(
+        question=query.question,
+        answer=result['answer'],
+        cached=result.get('cached', False),
+        source_files=result.get('source_files', []),
+        execution_time=result.get('execution_time', 0.0),
+        time_to_first_token=result.get('time_to_first_token'),
+        coalesced=result.get('coalesced', False),
+        success=True
+    )
+
+@app.post("/ask/stream")
+async def ask_stream(query: AskQuery):
+    """Stream the answer as newline-delimited JSON: {"token": ...} lines, then {"result": {...}}"""
+    validate_query(query.question, query.k, query.mode)
+    stream = rag.async_pipeline.astream(query.question, use_cache=query.use_cache, k=query.k, mode=query.mode)
+
+    async def lines():
+        async for chunk in stream:
+            yield json.dumps({"token": chunk}) + "\n"
+        yield json.dumps({"result": {key: value for key, value in stream.result.items() if key != 'answer'}}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.post("/search", response_model=SearchResponse)
+async def search(query: SearchQuery):
+    """Retrieve the k most relevant chunks (micro-batched with concurrent searches)"""
+    validate_query(query.question, query.k, query.mode)
+    start_time = time.time()
+    results = await search_batcher.search(query.question, query.k, query.mode)
+    return SearchResponse(
+        question=query.question,
+        results=[SearchResult(**result) for result in results],
+        execution_time=time.time() - start_time
+    )
+
+@app.post("/ingest", response_model=IngestResponse)
+async def ingest(file: UploadFile = File(...)):
+    """Add an uploaded document to the knowledge base folder and index it"""
+    filename = os.path.basename(file.filename or "")
+    if os.path.splitext(filename)[1].lower() not in SUPPORTED_DOC_TYPES:
+        raise HTTPException(status_code=400,
+                            detail=f"Unsupported file type; expected one of {', '.join(SUPPORTED_DOC_TYPES)}")
+
+    file_path = os.path.join(KNOWLEDGE_BASE_DIR, filename)
+    async with upload_lock:
+        if os.path.exists(file_path) or filename in rag.kb_manager.documents:
+            raise HTTPException(status_code=409,
+                                detail=f"{filename} already exists; upload it under another name, or replace the "
+                                       f"file in the knowledge base folder and call /ingest/scan")
+        await asyncio.to_thread(save_upload, file.file, file_path)
+    success = await asyncio.to_thread(rag.kb_manager.add_document, file_path, get_doc_type(file_path))
+    if not success:
+        raise HTTPException(status_code=422, detail=f"Could not index {filename}")
+    return IngestResponse(
+        filename=filename,
+        success=True,
+        chunks=rag.kb_manager.documents[filename]['chunks'],
+        total_documents=len(rag.kb_manager.documents)
+    )
+
+@app.post("/ingest/scan")
+async def ingest_scan():
+    """Index added/modified files in the knowledge base folder and drop deleted ones"""
+    changes = await asyncio.to_thread(rag.kb_manager.load_existing_documents)
+    return {"changes": changes, "total_documents": len(rag.kb_manager.documents)}
+
+@app.get("/stats")
+async def stats():
+    """Throughput and latency per endpoint, search batching and RAG system status"""
+    return {
+        "endpoints": latency.summary(),
+        "search_batching": search_batcher.get_stats(),
+        "system": rag.get_status()
+    }
+
+if __name__ == "__main__":
+    print("🧠 Starting RAG API Server...")
+    print("📖 API Documentation: http://localhost:8004/docs")
+    print("📊 Stats endpoint: http://localhost:8004/stats")
+
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8004,
+        log_level="info"
+    )
@@ -9,32 +9,134 @@ import json
 import hashlib
 import time
 import glob
+import math
+import re
+import shutil
+import threading
+import atexit
+import queue
+import asyncio
+import functools
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from collections import Counter, OrderedDict, deque
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union
 import sqlite3
 import logging
 from pathlib import Path
 
 # Core RAG imports
 from langchain_community.llms import Ollama
-from langchain_community.document_loaders import PyPDFLoader, TextLoader, CSVLoader
+from langchain_community.document_loaders import PyPDFLoader, TextLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import OllamaEmbeddings
+from langchain_ollama import OllamaEmbeddings
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.base import Docstore, AddableMixin
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+import faiss
 
 # PDF and Excel table extraction
 import pdfplumber
 import pandas as pd
 import openpyxl
+import numpy as np
 from io import StringIO
 
 # 🔥 Configuration
 ANSWER_MODEL = "phi3"
 EMBED_MODEL = "bge-m3"
-KNOWLEDGE_BASE_DIR = "documents"
-CACHE_DB = "rag_cache.db"
-LOG_FILE = "rag_debug.log"
+# Stamped on cached vectors, indexed documents and cached answers. Vectors come from Ollama's
+# batched /api/embed endpoint, which L2-normalizes them, so they don't mix with older /api/embeddings ones
+EMBED_MODEL_ID = f"{EMBED_MODEL}@api/embed"
+# Folder holding documents/, the cache databases and the log (empty: the current directory). Set
+# RAG_DATA_DIR before importing to run from elsewhere; relative paths in the manifest are read against it
+DATA_DIR = os.environ.get("RAG_DATA_DIR", "")
+KNOWLEDGE_BASE_DIR = os.path.join(DATA_DIR, "documents")
+CACHE_DB = os.path.join(DATA_DIR, "rag_cache.db")
+LOG_FILE = os.path.join(DATA_DIR, "rag_debug.log")
+EMBED_CACHE_DB = os.path.join(DATA_DIR, "rag_embed_cache.db")
+
+# SQLite
+SQLITE_BUSY_TIMEOUT = 30.0  # Seconds a writer waits on a locked database before failing
+SQLITE_STATEMENT_CACHE = 256  # Prepared statements kept per pooled connection
+SQLITE_POOL_SIZE = 8  # Idle connections kept per database; extra ones opened under load are closed on return
+LOG_QUEUE_MAX = 10000  # debug_logs records buffered in memory; newer records are dropped beyond this
+LOG_BATCH_SIZE = 200  # Records written per debug_logs transaction
+LOG_FLUSH_INTERVAL = 1.0  # Seconds the log writer waits before flushing a partial batch
+
+# Embedding pipeline
+EMBED_BATCH_SIZE = 32  # Chunks per embedding request
+EMBED_MAX_WORKERS = 4  # Embedding requests kept in flight
+QUERY_EMBED_CACHE_MAX_BYTES = 32 * 1024 * 1024  # In-process LRU budget for question vectors
+PERSIST_QUERY_EMBEDDINGS = True  # Keep question vectors in the embedding cache DB across restarts
+QUERY_EMBED_CACHE_MAX_ROWS = 100000  # Persisted question vectors; least recently used beyond this are pruned
+
+# Document ingestion
+SUPPORTED_DOC_TYPES = {'.pdf': 'pdf', '.txt': 'txt', '.csv': 'csv', '.xlsx': 'xlsx', '.xls': 'xlsx'}
+TEXT_SPLITTER = "table_aware"  # "table_aware" (CHUNK_TOKENS) or "recursive" (CHUNK_SIZE/CHUNK_OVERLAP characters)
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 150
+# Local tokenizer.json of EMBED_MODEL (e.g. from the BAAI/bge-m3 repository), read with the optional
+# `tokenizers` package. None counts tokens with TOKEN_ESTIMATE_PATTERN on every machine; chunk
+# boundaries (and so embedding-cache keys) depend on this setting, so keep it the same everywhere.
+EMBED_TOKENIZER_FILE = None
+CHUNK_TOKENS = {  # Chunk type -> (chunk size, overlap) in embedding tokens
+    "pdf": (320, 32),
+    "txt": (320, 32),
+    "table": (320, 0),  # Tables are cut between rows and repeat their title instead of overlapping
+    "excel": (320, 0),
+    "csv": (320, 0),
+}
+TABLE_CHUNK_TYPES = {"table", "excel", "csv"}
+INGEST_MAX_WORKERS = max(1, (os.cpu_count() or 2) - 1)  # Parser processes for bulk ingestion
+BULK_INGEST_MIN_FILES = 2  # New files at which load_existing_documents switches to bulk mode
+INGEST_START_METHOD = "spawn"  # Parser processes start fresh ("spawn"/"forkserver"); forking would copy held locks
+INGEST_STREAM_BATCH = EMBED_BATCH_SIZE * EMBED_MAX_WORKERS  # Chunks embedded and appended at a time by add_document
+PDF_PARALLEL_MIN_PAGES = 40  # PDFs with more pages are extracted across worker processes
+PDF_PAGES_PER_WORKER = 20  # Page range handed to each extraction process
+EXCEL_READ_CHUNK_ROWS = 5000  # Rows read and formatted at a time from a sheet
+CSV_READ_CHUNK_ROWS = 20000  # Rows read and formatted at a time from a CSV file
+EXCEL_COLUMN_SAMPLE_VALUES = 20  # Distinct values quoted in each column summary
+EXCEL_COLUMN_UNIQUE_CAP = 10000  # Distinct values tracked per column before reporting "N+"
+
+# Combined vector store (incremental appends + periodic compaction)
+COMBINED_VS_DIR = os.path.join(KNOWLEDGE_BASE_DIR, "combined_vs")
+COMBINED_MANIFEST_FILE = "combined_manifest.json"
+COMBINED_COMPACT_THRESHOLD = 25  # Appended documents before combined_vs is rewritten
+LAZY_STARTUP = True  # Defer loading combined_vs until the first search
+MMAP_COMBINED_INDEX = True  # Memory-map the codes in combined_vs/index.faiss (flat needs faiss >= 1.11)
+CHUNK_STORE_DB = os.path.join(KNOWLEDGE_BASE_DIR, "chunk_store.db")  # Chunk text/metadata keyed by vector id
+TABLE_STORE_DB = os.path.join(KNOWLEDGE_BASE_DIR, "table_store.db")  # Typed copies of extracted tables
+
+# Retrieval
+RETRIEVAL_MODE = "vector"  # "vector", "hybrid" (vector + BM25 fused) or "lexical" (BM25 only, no query embedding)
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60  # Reciprocal-rank fusion constant
+HYBRID_CANDIDATES = 20  # Candidates taken from each retriever before fusion
+STRUCTURED_QUERIES_ENABLED = True  # Answer aggregate/lookup questions about tables from the table store, without the LLM
+STRUCTURED_MAX_ROWS = 5  # Matching rows listed in a lookup answer
+
+# Answer cache
+SEMANTIC_CACHE_ENABLED = True  # Serve cached answers for paraphrased questions
+SEMANTIC_CACHE_THRESHOLD = 0.92  # Minimum cosine similarity between question embeddings
+ANSWER_CACHE_TTL_SECONDS = 7 * 24 * 3600  # Cached answers older than this are not served
+ANSWER_CACHE_MAX_ENTRIES = 5000  # Least recently used answers beyond this are pruned
+ANSWER_CACHE_PRUNE_INTERVAL = 300  # Seconds between background pruning passes (0 disables the thread)
+
+# Async pipeline
+LLM_MAX_CONCURRENCY = 2  # Generations sent to Ollama at once; further requests queue
+
+# Combined index backend
+INDEX_BACKEND = "flat"  # "flat", "ivf_flat" or "ivf_pq"
+IVF_NLIST = 1024  # Inverted lists (coarse clusters) for the IVF backends
+IVF_NPROBE = 16  # Lists visited per query: higher means better recall but slower search
+IVF_MIN_VECTORS = 10000  # Below this the combined index stays flat
+PQ_M = 64  # Sub-quantizers for ivf_pq (reduced to a divisor of the embedding dimension)
+PQ_NBITS = 8  # Bits per sub-quantizer code
 
 # Setup logging
 logging.basicConfig(
@@ -47,428 +149,3258 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def _process_pool(max_workers: int) -> ProcessPoolExecutor:
+    """Parser process pool that does not fork this (threaded) process"""
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(INGEST_START_METHOD))
+
+
+def _extract_pdf_pages(file_path: str, first_page: int, last_page: int) -> tuple:
+    """Documents and raw (name, DataFrame) tables for pages [first_page, last_page) (module level for worker processes)"""
+    tables = []
+    documents = list(_iter_pdf_pages(file_path, first_page, last_page,
+                                     lambda table_name, df: tables.append((table_name, df))))
+    return documents, tables
+
+
+def _iter_pdf_pages(file_path: str, first_page: int, last_page: int, table_sink=None):
+    """Yield text and table documents page by page from a single pdfplumber parse"""
+    with pdfplumber.open(file_path, pages=list(range(first_page + 1, last_page + 1))) as pdf:
+        for page in pdf.pages:
+            page_index = page.page_number - 1
+            text = page.extract_text() or ""
+            if text.strip():
+                yield Document(
+                    page_content=text,
+                    metadata={'source': file_path, 'page': page_index}
+                )
+            
+            # The default table settings find cells from ruling lines, so pages without any
+            # line or rect objects cannot yield tables and are not worth running detection on
+            if page.lines or page.rects:
+                try:
+                    for table_num, table in enumerate(page.extract_tables(), start=1):
+                        if table:
+                            # Convert table to DataFrame for better formatting
+                            df = pd.DataFrame(table[1:], columns=table[0] if table[0] else None)
+                            yield _table_document(file_path, page_index + 1, table_num, df)
+                            if table_sink:
+                                table_sink(f"page {page_index + 1} table {table_num}", df)
+                except Exception as e:
+                    logger.error(f"Error extracting tables from page {page_index + 1} of {file_path}: {e}")
+            page.close()
+
+
+def _table_document(file_path: str, page_num: int, table_num: int, df: pd.DataFrame) -> Document:
+    """Format one extracted table as a table view followed by key-value pairs"""
+    # Create structured text from table
+    table_text = f"\n=== TABLE {table_num} on Page {page_num} ===\n"
+    table_text += df.to_string(index=False)
+    table_text += "\n" + "="*50 + "\n"
+    
+    # Also create searchable key-value pairs (positionally, since header cells may repeat),
+    # one "Row N:" block per row so the splitter keeps each row whole
+    for row_num, row in enumerate(df.itertuples(index=False), start=1):
+        table_text += f"\nRow {row_num}:\n"
+        for col, value in zip(df.columns, row):
+            if pd.notna(value):
+                table_text += f"  {col}: {value}\n"
+    
+    return Document(
+        page_content=table_text,
+        metadata={
+            'source': file_path,
+            'page': page_num,
+            'type': 'table',
+            'table_number': table_num
+        }
+    )
+
+
 class EnhancedPDFLoader:
-    """Enhanced PDF loader that extracts both text and tables"""
+    """Enhanced PDF loader that extracts both text and tables
     
-    def __init__(self, file_path: str):
+    Text and tables come from one pdfplumber pass per page. PDFs longer than
+    PDF_PARALLEL_MIN_PAGES are split into page ranges extracted by worker processes.
+    Extracted tables are also passed to table_sink(table_name, DataFrame) when given.
+    """
+    
+    def __init__(self, file_path: str, max_workers: int = INGEST_MAX_WORKERS, table_sink=None):
         self.file_path = file_path
+        self.max_workers = max_workers
+        self.table_sink = table_sink
     
     def load(self) -> List[Document]:
         """Load PDF with text and table extraction"""
-        documents = []
-        
+        return list(self.lazy_load())
+    
+    def lazy_load(self):
+        """Yield documents page by page; worker ranges are consumed in order with at most max_workers in flight"""
         try:
-            # Extract text using PyPDFLoader
-            pdf_loader = PyPDFLoader(self.file_path)
-            text_docs = pdf_loader.load()
-            documents.extend(text_docs)
-            
-            # Extract tables using pdfplumber
             with pdfplumber.open(self.file_path) as pdf:
-                for page_num, page in enumerate(pdf.pages, start=1):
-                    tables = page.extract_tables()
-                    
-                    if tables:
-                        for table_num, table in enumerate(tables, start=1):
-                            if table and len(table) > 0:
-                                # Convert table to DataFrame for better formatting
-                                df = pd.DataFrame(table[1:], columns=table[0] if table[0] else None)
-                                
-                                # Create structured text from table
-                                table_text = f"\n=== TABLE {table_num} on Page {page_num} ===\n"
-                                table_text += df.to_string(index=False)
-                                table_text += "\n" + "="*50 + "\n"
-                                
-                                # Also create searchable key-value pairs
-                                for idx, row in df.iterrows():
-                                    for col in df.columns:
-                                        if pd.notna(row[col]):
-                                            table_text += f"{col}: {row[col]}\n"
-                                
-                                # Add as document
-                                doc = Document(
-                                    page_content=table_text,
-                                    metadata={
-                                        'source': self.file_path,
-                                        'page': page_num,
-                                        'type': 'table',
-                                        'table_number': table_num
-                                    }
-                                )
-                                documents.append(doc)
-                                
+                page_count = len(pdf.pages)
         except Exception as e:
-            logger.error(f"Error extracting tables from PDF {self.file_path}: {e}")
+            logger.error(f"Error extracting PDF {self.file_path}: {e}")
             # Fallback to regular PDF loading
-            pdf_loader = PyPDFLoader(self.file_path)
-            documents = pdf_loader.load()
+            yield from PyPDFLoader(self.file_path).lazy_load()
+            return
+        
+        # Inside a bulk-ingestion worker the files are already spread across processes
+        if (page_count <= PDF_PARALLEL_MIN_PAGES or self.max_workers <= 1
+                or multiprocessing.parent_process() is not None):
+            yield from _iter_pdf_pages(self.file_path, 0, page_count, self.table_sink)
+            return
         
+        ranges = [(first, min(first + PDF_PAGES_PER_WORKER, page_count))
+                  for first in range(0, page_count, PDF_PAGES_PER_WORKER)]
+        with _process_pool(min(self.max_workers, len(ranges))) as executor:
+            pending = deque()
+            for first, last in ranges:
+                pending.append(executor.submit(_extract_pdf_pages, self.file_path, first, last))
+                if len(pending) >= self.max_workers:
+                    yield from self._collect(pending.popleft())
+            while pending:
+                yield from self._collect(pending.popleft())
+    
+    def _collect(self, future) -> List[Document]:
+        """Documents of a finished page range, after handing its tables to the sink"""
+        documents, tables = future.result()
+        if self.table_sink:
+            for table_name, df in tables:
+                self.table_sink(table_name, df)
         return documents
 
 
 class EnhancedExcelLoader:
-    """Enhanced Excel loader that handles multiple sheets and all columns"""
+    """Enhanced Excel loader that handles multiple sheets and all columns
+    
+    Sheets are read EXCEL_READ_CHUNK_ROWS rows at a time (openpyxl read-only mode for .xlsx)
+    and formatted column-wise with pandas into row-group documents of about one chunk each,
+    followed by one summary document per column. Memory does not grow with sheet size.
+    Each chunk is also passed to table_sink(sheet_name, DataFrame) when given.
+    """
+    
+    DOC_TYPE = 'excel'
+    TITLE = 'EXCEL SHEET'
+    PART = 'Sheet'
     
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str, table_sink=None):
         self.file_path = file_path
+        self.table_sink = table_sink
     
     def load(self) -> List[Document]:
         """Load all sheets and columns from Excel file"""
-        documents = []
-        
+        return list(self.lazy_load())
+    
+    def lazy_load(self):
+        """Yield row-group and column-summary documents sheet by sheet"""
         try:
-            # Read all sheets
+            for sheet_name, frames in self._read_sheets():
+                yield from self._sheet_documents(sheet_name, frames)
+        except Exception as e:
+            logger.error(f"Error loading {self.DOC_TYPE} file {self.file_path}: {e}")
+    
+    def _read_sheets(self):
+        """Yield (sheet name, iterator of DataFrame chunks) for every sheet"""
+        if self.file_path.lower().endswith('.xls'):
+            # Legacy .xls has no streaming reader; read the sheet, then hand it out in chunks
             excel_file = pd.ExcelFile(self.file_path)
-            
             for sheet_name in excel_file.sheet_names:
                 df = pd.read_excel(excel_file, sheet_name=sheet_name)
-                
-                # Create structured content with all columns
-                sheet_content = f"\n=== EXCEL SHEET: {sheet_name} ===\n"
-                sheet_content += f"Columns: {', '.join(df.columns.tolist())}\n"
-                sheet_content += "="*60 + "\n\n"
-                
-                # Add full table view
-                sheet_content += df.to_string(index=False) + "\n\n"
-                
-                # Create searchable key-value content for each row
-                for idx, row in df.iterrows():
-                    row_content = f"Row {idx+1}:\n"
-                    for col in df.columns:
-                        if pd.notna(row[col]):
-                            row_content += f"  {col}: {row[col]}\n"
-                    sheet_content += row_content + "\n"
-                
-                # Add sheet as document
-                doc = Document(
-                    page_content=sheet_content,
-                    metadata={
-                        'source': self.file_path,
-                        'sheet': sheet_name,
-                        'type': 'excel',
-                        'columns': df.columns.tolist(),
-                        'row_count': len(df)
-                    }
+                yield sheet_name, (df.iloc[i:i + EXCEL_READ_CHUNK_ROWS]
+                                   for i in range(0, len(df), EXCEL_READ_CHUNK_ROWS))
+            return
+        
+        workbook = openpyxl.load_workbook(self.file_path, read_only=True, data_only=True)
+        try:
+            for worksheet in workbook.worksheets:
+                yield worksheet.title, self._read_worksheet(worksheet)
+        finally:
+            workbook.close()
+    
+    @staticmethod
+    def _read_worksheet(worksheet):
+        """Stream a read-only worksheet as DataFrame chunks; the first row holds the headers"""
+        rows = worksheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(name) if name is not None else f"Unnamed: {i}" for i, name in enumerate(header)]
+        first_row = 0
+        while True:
+            block = [row for _, row in zip(range(EXCEL_READ_CHUNK_ROWS), rows)]
+            if not block:
+                return
+            df = pd.DataFrame(block)
+            # Cells past the header row get pandas-style names instead of being dropped
+            columns += [f"Unnamed: {i}" for i in range(len(columns), df.shape[1])]
+            df = df.reindex(columns=range(len(columns)))
+            df.columns = columns
+            df.index = pd.RangeIndex(first_row, first_row + len(block))
+            first_row += len(block)
+            yield df.dropna(how='all')
+    
+    def _sheet_documents(self, sheet_name: str, frames):
+        """Row-group documents for each chunk, then column summaries once the sheet is done"""
+        stats = {}
+        columns = []
+        for df in frames:
+            if df.empty:
+                continue
+            columns = [str(col) for col in df.columns]
+            self._update_column_stats(stats, df)
+            if self.table_sink:
+                self.table_sink(sheet_name, df)
+            yield from self._row_group_documents(sheet_name, df, columns)
+        for col in columns:
+            yield self._column_document(sheet_name, col, stats[col])
+    
+    def _row_group_documents(self, sheet_name: str, df: pd.DataFrame, columns: List[str]):
+        """Format rows as 'col: value' lines column by column and cut them into chunk-sized groups"""
+        row_numbers = df.index.to_numpy() + 1
+        texts = pd.Series([f"Row {n}:\n" for n in row_numbers], index=df.index, dtype=object)
+        for col, name in zip(df.columns, columns):
+            values = df[col]
+            texts += (f"  {name}: " + values.astype(str) + "\n").where(values.notna(), "")
+        # Measure rows the way the splitter will, leaving room for the sheet/row-range header,
+        # so each group stays within one chunk
+        chunk_size, length = chunk_budget(self.DOC_TYPE)
+        lengths = texts.map(length).to_numpy() + length("\n")
+        texts = texts.to_numpy()
+        budget = chunk_size - length(f"=== {self.TITLE}: {sheet_name} (rows {row_numbers[-1]}-{row_numbers[-1]}) ===\n")
+        
+        start = 0
+        while start < len(texts):
+            end = start + 1
+            size = lengths[start]
+            while end < len(texts) and size + lengths[end] <= budget:
+                size += lengths[end]
+                end += 1
+            first_row, last_row = int(row_numbers[start]), int(row_numbers[end - 1])
+            yield Document(
+                page_content=f"=== {self.TITLE}: {sheet_name} (rows {first_row}-{last_row}) ===\n"
+                             + "\n".join(texts[start:end]),
+                metadata={
+                    'source': self.file_path,
+                    'sheet': sheet_name,
+                    'type': self.DOC_TYPE,
+                    'columns': columns,
+                    'row_start': first_row,
+                    'row_end': last_row,
+                    'row_count': end - start
+                }
+            )
+            start = end
+    
+    @staticmethod
+    def _update_column_stats(stats: Dict[str, Dict], df: pd.DataFrame):
+        """Fold one chunk into per-column counts, bounded distinct values and numeric or date ranges
+        
+        Only numeric dtypes (not bool) get Min/Max/Mean and datetime dtypes get Min/Max; a column
+        whose dtype differs between chunks gets neither.
+        """
+        for col in df.columns:
+            values = df[col].dropna()
+            entry = stats.setdefault(str(col), {
+                'count': 0, 'unique': set(), 'unique_capped': False, 'kind': None,
+                'min': None, 'max': None, 'sum': 0.0
+            })
+            if values.empty:
+                continue
+            entry['count'] += len(values)
+            if not entry['unique_capped']:
+                entry['unique'].update(values.astype(str).unique()[:EXCEL_COLUMN_UNIQUE_CAP])
+                if len(entry['unique']) >= EXCEL_COLUMN_UNIQUE_CAP:
+                    entry['unique_capped'] = True
+            if pd.api.types.is_bool_dtype(values):
+                kind = 'text'
+            elif pd.api.types.is_datetime64_any_dtype(values):
+                kind = 'datetime'
+            elif pd.api.types.is_numeric_dtype(values):
+                kind = 'numeric'
+            else:
+                kind = 'text'
+            entry['kind'] = kind if entry['kind'] in (None, kind) else 'text'
+            if entry['kind'] != 'text':
+                low, high = values.min(), values.max()
+                entry['min'] = low if entry['min'] is None else min(entry['min'], low)
+                entry['max'] = high if entry['max'] is None else max(entry['max'], high)
+                if kind == 'numeric':
+                    entry['sum'] += float(values.sum())
+    
+    def _column_document(self, sheet_name: str, col: str, stats: Dict) -> Document:
+        """Summary of one column: counts, sample values and numeric or date range"""
+        unique = f"{len(stats['unique'])}+" if stats['unique_capped'] else str(len(stats['unique']))
+        samples = sorted(stats['unique'])[:EXCEL_COLUMN_SAMPLE_VALUES]
+        col_content = f"\n=== Column '{col}' from {self.PART} '{sheet_name}' ===\n"
+        col_content += f"Non-empty values: {stats['count']}\n"
+        col_content += f"Unique values: {unique}\n"
+        col_content += f"Sample values: {samples}\n"
+        if stats['kind'] in ('numeric', 'datetime'):
+            col_content += f"Min: {stats['min']}, Max: {stats['max']}\n"
+        if stats['kind'] == 'numeric':
+            col_content += f"Mean: {stats['sum'] / stats['count']:.2f}\n"
+        return Document(
+            page_content=col_content,
+            metadata={
+                'source': self.file_path,
+                'sheet': sheet_name,
+                'type': f"{self.DOC_TYPE}_column",
+                'column_name': col
+            }
+        )
+
+
+class EnhancedCSVLoader(EnhancedExcelLoader):
+    """CSV loader with the Excel loader's row-group and column-summary documents
+    
+    The file is read CSV_READ_CHUNK_ROWS rows at a time with pandas, so the number of documents
+    (and embeddings) follows the size of the data rather than its row count.
+    """
+    
+    DOC_TYPE = 'csv'
+    TITLE = 'CSV FILE'
+    PART = 'File'
+    
+    def _read_sheets(self):
+        """The whole file as a single 'sheet' named after it, in DataFrame chunks"""
+        yield os.path.basename(self.file_path), pd.read_csv(
+            self.file_path, chunksize=CSV_READ_CHUNK_ROWS, encoding_errors='replace'
+        )
+
+
+def get_doc_type(file_path: str) -> str:
+    """Map a file extension to the loader type used by add_document"""
+    file_ext = os.path.splitext(file_path)[1].lower()
+    return SUPPORTED_DOC_TYPES.get(file_ext, 'txt')
+
+
+def load_and_split_document(file_path: str, doc_type: str) -> List[Document]:
+    """Parse and chunk a document (module level so bulk ingestion can run it in worker processes)"""
+    return list(iter_document_chunks(file_path, doc_type))
+
+
+def load_split_and_extract_tables(file_path: str, doc_type: str) -> tuple:
+    """Chunks plus (table name, DataFrame) tables of a document, for bulk ingestion workers"""
+    tables = []
+    chunks = list(iter_document_chunks(file_path, doc_type, lambda table_name, df: tables.append((table_name, df))))
+    return chunks, tables
+
+
+def get_loader(file_path: str, doc_type: str, table_sink=None):
+    """Loader for a document type; PDF tables, Excel sheets and CSV files are also passed to table_sink"""
+    # Use enhanced loaders for PDF, Excel and CSV
+    if doc_type == "pdf":
+        return EnhancedPDFLoader(file_path, table_sink=table_sink)
+    elif doc_type == "xlsx" or doc_type == "excel":
+        return EnhancedExcelLoader(file_path, table_sink=table_sink)
+    elif doc_type == "txt":
+        return TextLoader(file_path)
+    elif doc_type == "csv":
+        return EnhancedCSVLoader(file_path, table_sink=table_sink)
+    else:
+        raise ValueError(f"Unsupported document type: {doc_type}")
+
+
+def extract_document_tables(file_path: str, doc_type: str, table_sink):
+    """Pass every table of a document to table_sink without chunking or embedding anything"""
+    if doc_type in ("pdf", "xlsx", "excel", "csv"):
+        for _ in get_loader(file_path, doc_type, table_sink).lazy_load():
+            pass
+
+
+TOKEN_ESTIMATE_PATTERN = re.compile(r"\w{1,4}|[^\w\s]")
+
+
+@functools.lru_cache(maxsize=1)
+def _load_tokenizer():
+    """Tokenizer read from EMBED_TOKENIZER_FILE, or None to use the estimate
+    
+    A configured tokenizer that cannot be loaded is an error rather than a silent switch to the
+    estimate, which would chunk the same documents differently.
+    """
+    if not EMBED_TOKENIZER_FILE:
+        return None
+    try:
+        from tokenizers import Tokenizer
+    except ImportError as e:
+        raise RuntimeError(f"EMBED_TOKENIZER_FILE is set but the `tokenizers` package is not installed: {e}")
+    tokenizer = Tokenizer.from_file(EMBED_TOKENIZER_FILE)
+    logger.info(f"Counting chunk tokens with {EMBED_TOKENIZER_FILE}")
+    return tokenizer
+
+
+def count_tokens(text: str) -> int:
+    """Embedding-model tokens in text (without EMBED_TOKENIZER_FILE: 4-character word pieces plus punctuation)"""
+    tokenizer = _load_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+    return len(TOKEN_ESTIMATE_PATTERN.findall(text))
+
+
+class TableAwareTextSplitter:
+    """Splits documents into chunks measured in embedding tokens, sized per document type
+    
+    Text is packed from whole paragraphs, falling back to sentences (across wrapped lines) and words
+    only when a paragraph does not fit, with whole trailing units repeated as overlap. Tables are packed from
+    whole rows ("Row N:" blocks, or lines of a rendered grid) that are never cut, and their
+    "=== ... ===" title is repeated on every chunk instead of overlapping.
+    """
+    
+    TITLE = re.compile(r"^=== .+ ===$")
+    RULE = re.compile(r"^[=\-]+$")
+    ROW_BLOCK = re.compile(r"^Row \d+:")
+    SENTENCE_END = re.compile(r"(?<=[.!?])(\s+)")
+    
+    def __init__(self, doc_type: str = "txt", chunk_tokens: Optional[Dict[str, tuple]] = None,
+                 length_function=count_tokens):
+        self.doc_type = doc_type
+        self.chunk_tokens = chunk_tokens or CHUNK_TOKENS
+        self.length_function = length_function
+    
+    def settings_for(self, doc: Document) -> tuple:
+        """(chunk size, overlap, is table) from the loader's chunk type, else the file's document type"""
+        chunk_type = str(doc.metadata.get('type') or self.doc_type).replace("_column", "")
+        if chunk_type not in self.chunk_tokens:
+            chunk_type = self.doc_type if self.doc_type in self.chunk_tokens else "txt"
+        chunk_size, overlap = self.chunk_tokens[chunk_type]
+        return chunk_size, overlap, chunk_type in TABLE_CHUNK_TYPES
+    
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        """Split each document with the settings of its type; chunks keep the document's metadata"""
+        return [
+            Document(page_content=text, metadata=dict(doc.metadata))
+            for doc in documents
+            for text in self.split_text(doc.page_content, *self.settings_for(doc))
+        ]
+    
+    def split_text(self, text: str, chunk_size: int, overlap: int = 0, is_table: bool = False) -> List[str]:
+        text = text.strip("\n")
+        title = ""
+        if is_table:
+            first_line, _, rest = text.partition("\n")
+            if self.TITLE.match(first_line.strip()):
+                title, text = first_line.strip(), rest.strip("\n")
+                chunk_size = max(chunk_size // 2, chunk_size - self.length_function(title))
+        
+        groups = self._pack(self._units(text, chunk_size, is_table), chunk_size, overlap)
+        if is_table:
+            groups = self._merge_rule_groups(groups)
+        chunks = [self._join(group) for group in groups]
+        chunks = [f"{title}\n{chunk}" if title else chunk for chunk in chunks if chunk.strip()]
+        return chunks or ([title] if title else [])
+    
+    def _units(self, text: str, chunk_size: int, is_table: bool) -> List[tuple]:
+        """(separator, text, tokens) pieces that are packed without being cut"""
+        units = []
+        for paragraph in re.split(r"\n\s*\n", text):
+            if not paragraph.strip():
+                continue
+            tokens = self.length_function(paragraph)
+            # A table row stays whole even when it alone exceeds the chunk size
+            if tokens <= chunk_size or (is_table and self.ROW_BLOCK.match(paragraph.strip())):
+                units.append(("\n\n", paragraph, tokens))
+                continue
+            if is_table:
+                # A rendered grid: one row per line
+                units.extend(("\n\n" if line_num == 0 else "\n", line, self.length_function(line))
+                             for line_num, line in enumerate(paragraph.split("\n")))
+                continue
+            # Split pieces keep the whitespace that preceded them, so chunks reproduce the source text
+            pieces = self.SENTENCE_END.split(paragraph)
+            for separator, sentence in zip(["\n\n"] + pieces[1::2], pieces[0::2]):
+                tokens = self.length_function(sentence)
+                if tokens <= chunk_size:
+                    units.append((separator, sentence, tokens))
+                    continue
+                words = re.split(r"(\s+)", sentence)
+                units.extend((word_separator, word, self.length_function(word))
+                             for word_separator, word in zip([separator] + words[1::2], words[0::2]) if word)
+        return units
+    
+    @staticmethod
+    def _pack(units: List[tuple], chunk_size: int, overlap: int) -> List[List[tuple]]:
+        """Greedily fill chunks; each new chunk starts with whole trailing units of the last one up to overlap tokens"""
+        groups, current, size = [], [], 0
+        for unit in units:
+            tokens = unit[2]
+            if current and size + tokens > chunk_size:
+                groups.append(current)
+                carried, carried_size = [], 0
+                for previous in reversed(current):
+                    if carried_size + previous[2] > overlap or carried_size + previous[2] + tokens > chunk_size:
+                        break
+                    carried.insert(0, previous)
+                    carried_size += previous[2]
+                current, size = carried, carried_size
+            current.append(unit)
+            size += tokens
+        if current:
+            groups.append(current)
+        return groups
+    
+    @classmethod
+    def _merge_rule_groups(cls, groups: List[List[tuple]]) -> List[List[tuple]]:
+        """Fold a group holding only "=====" rules (a title-only chunk once the title is added) into the next group"""
+        merged = []
+        for group in groups:
+            if merged and all(cls.RULE.match(text.strip()) for _, text, _ in merged[-1]):
+                group = merged.pop() + group
+            merged.append(group)
+        if len(merged) > 1 and all(cls.RULE.match(text.strip()) for _, text, _ in merged[-1]):
+            merged[-2] = merged[-2] + merged.pop()
+        return merged
+    
+    @staticmethod
+    def _join(group: List[tuple]) -> str:
+        return group[0][1] + "".join(separator + text for separator, text, _ in group[1:])
+
+
+def get_text_splitter(doc_type: str):
+    """Chunker for ingestion, chosen by TEXT_SPLITTER"""
+    if TEXT_SPLITTER == "recursive":
+        return RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    return TableAwareTextSplitter(doc_type)
+
+
+def resolve_data_path(path: str) -> str:
+    """A document path recorded in the manifest, as seen from this process"""
+    return os.path.join(DATA_DIR, path)
+
+
+def chunk_budget(chunk_type: str) -> tuple:
+    """(chunk size, length function) the configured splitter applies to a chunk type"""
+    if TEXT_SPLITTER == "recursive":
+        return CHUNK_SIZE, len
+    return CHUNK_TOKENS.get(chunk_type, CHUNK_TOKENS["table"])[0], count_tokens
+
+
+def iter_document_chunks(file_path: str, doc_type: str, table_sink=None):
+    """Yield the chunks of a document as its loader produces pages, sheets or rows"""
+    loader = get_loader(file_path, doc_type, table_sink)
+    splitter = get_text_splitter(doc_type)
+    for doc in loader.lazy_load():
+        yield from splitter.split_documents([doc])
+
+
+def configure_index(index, nprobe: Optional[int] = None):
+    """Apply search-time parameters to a FAISS index"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = nprobe or IVF_NPROBE
+
+
+def build_backend_index(vectors: np.ndarray, backend: Optional[str] = None):
+    """Build a FAISS index for the configured backend; small corpora stay on an exact flat index"""
+    backend = backend or INDEX_BACKEND
+    num_vectors, dimensions = vectors.shape
+    # PQ training needs at least one point per codebook centroid
+    too_few_for_pq = backend == "ivf_pq" and num_vectors < 2 ** PQ_NBITS
+    if backend == "flat" or num_vectors < IVF_MIN_VECTORS or too_few_for_pq:
+        index = faiss.IndexFlatL2(dimensions)
+        index.add(vectors)
+        return index
+    
+    nlist = min(IVF_NLIST, max(1, num_vectors // 39))  # FAISS wants ~39 training points per list
+    if backend == "ivf_flat":
+        spec = f"IVF{nlist},Flat"
+    elif backend == "ivf_pq":
+        pq_m = PQ_M
+        while dimensions % pq_m:
+            pq_m -= 1
+        spec = f"IVF{nlist},PQ{pq_m}x{PQ_NBITS}"
+    else:
+        raise ValueError(f"Unsupported index backend: {backend}")
+    
+    index = faiss.index_factory(dimensions, spec)
+    # A sample is enough to train the coarse quantizer and PQ codebooks
+    train_size = nlist * 256
+    if num_vectors > train_size:
+        sample = vectors[np.random.default_rng(0).choice(num_vectors, train_size, replace=False)]
+    else:
+        sample = vectors
+    index.train(sample)
+    index.add_with_ids(vectors, np.arange(num_vectors, dtype=np.int64))
+    configure_index(index)
+    return index
+
+
+class SQLiteConnectionPool:
+    """Checkout/return pool of persistent SQLite connections in WAL mode, keyed by database path
+    
+    connection() hands out an idle connection (or opens one) and release() returns it;
+    connect() pairs the two in a with block. Short-lived threads (per-call executors,
+    Streamlit script runs) reuse connections and their prepared-statement caches instead
+    of reconnecting. At most pool_size idle
+    connections are kept per database. WAL lets readers proceed while a writer commits,
+    and busy_timeout makes writers queue instead of failing with "database is locked".
+    """
+    
+    def __init__(self, busy_timeout: float = SQLITE_BUSY_TIMEOUT,
+                 cached_statements: int = SQLITE_STATEMENT_CACHE, pool_size: int = SQLITE_POOL_SIZE):
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._idle = {}  # db path -> idle connections, most recently returned last
+        self._checked_out = {}  # id(connection) -> (db path, connection)
+        self.stats = {'connects': 0, 'reuses': 0, 'discarded': 0}
+    
+    def connection(self, db_path: str) -> sqlite3.Connection:
+        """Check out a connection to db_path; hand it back with release()"""
+        key = os.path.abspath(db_path)
+        with self._lock:
+            idle = self._idle.get(key)
+            conn = idle.pop() if idle else None
+            if conn is not None:
+                self.stats['reuses'] += 1
+                self._checked_out[id(conn)] = (key, conn)
+                return conn
+        
+        conn = sqlite3.connect(key, timeout=self.busy_timeout, cached_statements=self.cached_statements,
+                               check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout * 1000)}")
+        with self._lock:
+            self.stats['connects'] += 1
+            self._checked_out[id(conn)] = (key, conn)
+        return conn
+    
+    @contextmanager
+    def connect(self, db_path: str):
+        """Check out a connection to db_path for the duration of a with block"""
+        conn = self.connection(db_path)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+    
+    def release(self, conn: sqlite3.Connection):
+        """Return a connection after use, ending any transaction a failed statement left open"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            reusable = True
+        except sqlite3.Error:
+            reusable = False
+        with self._lock:
+            entry = self._checked_out.pop(id(conn), None)
+            if entry is not None and reusable:
+                idle = self._idle.setdefault(entry[0], [])
+                if len(idle) < self.pool_size:
+                    idle.append(conn)
+                    return
+            self.stats['discarded'] += 1
+        conn.close()
+    
+    def close_all(self):
+        """Close every pooled connection, idle or checked out"""
+        with self._lock:
+            connections = [conn for idle in self._idle.values() for conn in idle]
+            connections += [conn for _, conn in self._checked_out.values()]
+            self._idle = {}
+            self._checked_out = {}
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+DB_POOL = SQLiteConnectionPool()
+atexit.register(DB_POOL.close_all)
+
+
+class AsyncLogWriter:
+    """Writes debug_logs records from a background thread in batched transactions
+    
+    log() only enqueues, so instrumentation never waits on SQLite. When the queue is
+    full new records are dropped and counted; the count is written as a
+    'log_records_dropped' record once there is room again. Pending records are
+    flushed on close() and at interpreter exit.
+    """
+    
+    _STOP = object()
+    
+    def __init__(self, db_path: str = CACHE_DB, max_queue: int = LOG_QUEUE_MAX,
+                 batch_size: int = LOG_BATCH_SIZE, flush_interval: float = LOG_FLUSH_INTERVAL):
+        self.db_path = db_path
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max(1, max_queue))
+        self._dropped_lock = threading.Lock()
+        self.dropped = 0  # Records dropped since the last drop summary was written
+        self.total_dropped = 0
+        self.written = 0
+        self._thread = threading.Thread(target=self._run, name="debug-log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+    
+    def log(self, operation: str, details: str, execution_time: float):
+        """Queue one record without blocking"""
+        # Same UTC format as the column's CURRENT_TIMESTAMP default, taken when the event happened
+        record = (time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()), operation, details, execution_time)
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+                self.total_dropped += 1
+    
+    def _run(self):
+        """Collect records into batches and write each batch in one transaction"""
+        while True:
+            items = []
+            try:
+                items.append(self._queue.get(timeout=self.flush_interval))
+                while len(items) < self.batch_size and items[-1] is not self._STOP:
+                    items.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            stop = bool(items) and items[-1] is self._STOP
+            self._write([item for item in items if item is not self._STOP])
+            for _ in items:
+                self._queue.task_done()
+            if stop:
+                return
+    
+    def _write(self, records: List[tuple]):
+        """Insert a batch, plus a summary of records dropped since the last write"""
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            records.append((time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()), "log_records_dropped",
+                            f"Dropped {dropped} debug log records: queue full", 0.0))
+        if not records:
+            return
+        with DB_POOL.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.executemany('''
+                    INSERT INTO debug_logs (timestamp, operation, details, execution_time)
+                    VALUES (?, ?, ?, ?)
+                ''', records)
+                conn.commit()
+                self.written += len(records)
+            except Exception as e:
+                logger.error(f"Error writing {len(records)} debug log records: {e}")
+    
+    def flush(self):
+        """Block until every queued record has been written"""
+        if self._thread.is_alive():
+            self._queue.join()
+    
+    def close(self):
+        """Flush pending records and stop the writer thread"""
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join(timeout=10)
+    
+    def get_stats(self) -> Dict[str, int]:
+        """Queued, written and dropped record counts"""
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.total_dropped
+        }
+
+
+class ReadWriteLock:
+    """Many concurrent readers or one writer
+    
+    Waiting writers block new readers, so ingestion is not starved by a stream of
+    searches. The writing thread may re-enter write() and take read(); a thread that
+    holds read() must not ask for write().
+    """
+    
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = None
+        self._write_depth = 0
+        self._writers_waiting = 0
+        self._local = threading.local()
+    
+    @contextmanager
+    def read(self):
+        me = threading.get_ident()
+        reads = getattr(self._local, 'reads', 0)
+        with self._cond:
+            if self._writer != me and reads == 0:
+                while self._writer is not None or self._writers_waiting:
+                    self._cond.wait()
+            self._readers += 1
+        self._local.reads = reads + 1
+        try:
+            yield
+        finally:
+            self._local.reads -= 1
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+    
+    @contextmanager
+    def write(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._write_depth += 1
+            else:
+                if getattr(self._local, 'reads', 0):
+                    raise RuntimeError("Cannot take the write lock while holding the read lock")
+                self._writers_waiting += 1
+                try:
+                    while self._writer is not None or self._readers:
+                        self._cond.wait()
+                finally:
+                    self._writers_waiting -= 1
+                self._writer = me
+                self._write_depth = 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._write_depth -= 1
+                if self._write_depth == 0:
+                    self._writer = None
+                    self._cond.notify_all()
+
+
+def write_locked(method):
+    """Run a KnowledgeBaseManager method holding its write lock"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.rw_lock.write():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def ingest_locked(method):
+    """Run a KnowledgeBaseManager method holding its ingest lock
+    
+    Ingests run one at a time but leave searches running: parsing and embedding happen
+    under this lock only, and the method takes the write lock itself to publish results.
+    Lock order is ingest lock, then write lock.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.ingest_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class SQLiteChunkStore(Docstore, AddableMixin):
+    """Docstore that keeps chunk text and metadata on disk, keyed by vector id
+    
+    Replaces the pickled in-memory docstore (index.pkl) of LangChain's FAISS wrapper. Every
+    per-document store and the combined store share one row per chunk, and a search reads
+    only the rows of its k hits. The position -> chunk id map of each saved FAISS index is
+    kept here as well.
+    """
+    
+    def __init__(self, db_path: str = CHUNK_STORE_DB):
+        self.db_path = db_path
+        self.init_store_db()
+    
+    def init_store_db(self):
+        """Initialize SQLite database for chunks and vector id maps"""
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        with DB_POOL.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS chunks (
+                    chunk_id TEXT PRIMARY KEY,
+                    doc_name TEXT,
+                    content TEXT,
+                    metadata TEXT
                 )
-                documents.append(doc)
-                
-                # Also create column-specific documents for better searching
-                for col in df.columns:
-                    col_content = f"\n=== Column '{col}' from Sheet '{sheet_name}' ===\n"
-                    col_values = df[col].dropna().tolist()
-                    col_content += f"Values: {col_values}\n"
-                    col_content += f"Unique values: {df[col].nunique()}\n"
-                    
-                    if df[col].dtype in ['int64', 'float64']:
-                        col_content += f"Min: {df[col].min()}, Max: {df[col].max()}\n"
-                        col_content += f"Mean: {df[col].mean():.2f}\n"
-                    
-                    col_doc = Document(
-                        page_content=col_content,
-                        metadata={
-                            'source': self.file_path,
-                            'sheet': sheet_name,
-                            'type': 'excel_column',
-                            'column_name': col
-                        }
+            ''')
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_chunks_doc_name ON chunks (doc_name)")
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS vector_ids (
+                    store TEXT,
+                    position INTEGER,
+                    chunk_id TEXT,
+                    PRIMARY KEY (store, position)
+                )
+            ''')
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_vector_ids_chunk ON vector_ids (chunk_id)")
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS vector_stores (
+                    store TEXT PRIMARY KEY,
+                    ntotal INTEGER,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.commit()
+    
+    def add(self, texts: Dict[str, Document]) -> None:
+        """Store chunks under their vector ids"""
+        with DB_POOL.connect(self.db_path) as conn:
+            conn.executemany('''
+                INSERT OR REPLACE INTO chunks (chunk_id, doc_name, content, metadata)
+                VALUES (?, ?, ?, ?)
+            ''', [
+                (chunk_id, os.path.basename(doc.metadata.get('source', '')), doc.page_content,
+                 json.dumps(doc.metadata, default=str))
+                for chunk_id, doc in texts.items()
+            ])
+            conn.commit()
+    
+    def search(self, search: str) -> Union[str, Document]:
+        """Fetch one chunk by vector id"""
+        with DB_POOL.connect(self.db_path) as conn:
+            row = conn.execute(
+                "SELECT content, metadata FROM chunks WHERE chunk_id = ?", (search,)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+    
+    def delete(self, ids: List) -> None:
+        """Rows are kept until garbage_collect: the persisted combined base may still reference them"""
+        return None
+    
+    def get_chunk_ids(self, doc_name: str) -> List[str]:
+        """Vector ids of every stored chunk of a document"""
+        with DB_POOL.connect(self.db_path) as conn:
+            rows = conn.execute("SELECT chunk_id FROM chunks WHERE doc_name = ?", (doc_name,)).fetchall()
+        return [row[0] for row in rows]
+    
+    def get_store_chunks(self, store: str) -> Dict[str, str]:
+        """chunk_id -> text for every vector of a saved FAISS index"""
+        with DB_POOL.connect(self.db_path) as conn:
+            rows = conn.execute('''
+                SELECT c.chunk_id, c.content FROM vector_ids v
+                JOIN chunks c ON c.chunk_id = v.chunk_id
+                WHERE v.store = ?
+            ''', (store,)).fetchall()
+        return dict(rows)
+    
+    def save_id_map(self, store: str, index_to_docstore_id: Dict[int, str]):
+        """Persist the position -> chunk id map of a saved FAISS index"""
+        with DB_POOL.connect(self.db_path) as conn:
+            conn.execute("DELETE FROM vector_ids WHERE store = ?", (store,))
+            conn.executemany(
+                "INSERT INTO vector_ids (store, position, chunk_id) VALUES (?, ?, ?)",
+                [(store, int(position), chunk_id) for position, chunk_id in index_to_docstore_id.items()]
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO vector_stores (store, ntotal) VALUES (?, ?)",
+                (store, len(index_to_docstore_id))
+            )
+            conn.commit()
+    
+    def load_id_map(self, store: str) -> Optional[Dict[int, str]]:
+        """Position -> chunk id map of a saved FAISS index, or None if the store was never saved here"""
+        with DB_POOL.connect(self.db_path) as conn:
+            if conn.execute("SELECT 1 FROM vector_stores WHERE store = ?", (store,)).fetchone() is None:
+                return None
+            rows = conn.execute("SELECT position, chunk_id FROM vector_ids WHERE store = ?", (store,)).fetchall()
+        return {position: chunk_id for position, chunk_id in rows}
+    
+    def delete_store(self, store: str):
+        """Forget the id map of a deleted FAISS index"""
+        with DB_POOL.connect(self.db_path) as conn:
+            conn.execute("DELETE FROM vector_ids WHERE store = ?", (store,))
+            conn.execute("DELETE FROM vector_stores WHERE store = ?", (store,))
+            conn.commit()
+    
+    def garbage_collect(self) -> int:
+        """Delete chunks no saved index references any more"""
+        with DB_POOL.connect(self.db_path) as conn:
+            cursor = conn.execute(
+                "DELETE FROM chunks WHERE chunk_id NOT IN (SELECT chunk_id FROM vector_ids)"
+            )
+            conn.commit()
+            return cursor.rowcount
+
+
+class BM25Index:
+    """Persistent BM25 inverted index over chunks, stored alongside the chunk store
+    
+    Postings of a document being (re)indexed are added under a staging name, which searches
+    skip, and swapped in by promote() when the document is registered.
+    """
+    
+    STAGING_PREFIX = "staging/"  # Cannot occur in a file name
+    TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._-][a-z0-9]+)*")
+    STOPWORDS = {
+        'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is', 'it',
+        'of', 'on', 'or', 'that', 'the', 'this', 'to', 'was', 'what', 'which', 'with'
+    }
+    
+    def __init__(self, db_path: str = CHUNK_STORE_DB):
+        self.db_path = db_path
+        self._stats = None  # (chunk count, average chunk length), reset on writes
+        self.init_index_db()
+    
+    def init_index_db(self):
+        """Initialize SQLite tables for postings and chunk lengths"""
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        with DB_POOL.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS bm25_postings (
+                    term TEXT,
+                    chunk_id TEXT,
+                    tf INTEGER,
+                    PRIMARY KEY (term, chunk_id)
+                ) WITHOUT ROWID
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS bm25_docs (
+                    chunk_id TEXT PRIMARY KEY,
+                    doc_name TEXT,
+                    length INTEGER
+                )
+            ''')
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_bm25_docs_doc_name ON bm25_docs (doc_name)")
+            conn.commit()
+            # Postings staged by an ingest that never finished
+            staged = [row[0] for row in conn.execute(
+                "SELECT DISTINCT doc_name FROM bm25_docs WHERE doc_name LIKE ?", (self.STAGING_PREFIX + "%",)
+            ).fetchall()]
+        for doc_name in staged:
+            self.remove_document(doc_name)
+    
+    @classmethod
+    def tokenize(cls, text: str) -> List[str]:
+        """Lowercased terms; keeps SKUs and decimals like 'a1-b2' or '3.5' whole"""
+        return [token for token in cls.TOKEN_PATTERN.findall(text.lower()) if token not in cls.STOPWORDS]
+    
+    def index_document(self, doc_name: str, chunks: Dict[str, str]):
+        """Replace the postings of a document with those of its current chunks"""
+        self.remove_document(doc_name)
+        self.add_chunks(doc_name, chunks)
+    
+    def add_chunks(self, doc_name: str, chunks: Dict[str, str]):
+        """Add postings for more chunks of a document"""
+        postings = []
+        lengths = []
+        for chunk_id, text in chunks.items():
+            terms = Counter(self.tokenize(text))
+            lengths.append((chunk_id, doc_name, sum(terms.values())))
+            postings.extend((term, chunk_id, tf) for term, tf in terms.items())
+        
+        with DB_POOL.connect(self.db_path) as conn:
+            conn.executemany("INSERT OR REPLACE INTO bm25_docs (chunk_id, doc_name, length) VALUES (?, ?, ?)", lengths)
+            conn.executemany("INSERT OR REPLACE INTO bm25_postings (term, chunk_id, tf) VALUES (?, ?, ?)", postings)
+            conn.commit()
+        self._stats = None
+    
+    @staticmethod
+    def _delete_postings(conn: sqlite3.Connection, doc_name: str):
+        """Delete a document's postings within the caller's transaction"""
+        conn.execute('''
+            DELETE FROM bm25_postings WHERE chunk_id IN
+            (SELECT chunk_id FROM bm25_docs WHERE doc_name = ?)
+        ''', (doc_name,))
+        conn.execute("DELETE FROM bm25_docs WHERE doc_name = ?", (doc_name,))
+    
+    def remove_document(self, doc_name: str):
+        """Drop every posting of a document"""
+        with DB_POOL.connect(self.db_path) as conn:
+            self._delete_postings(conn, doc_name)
+            conn.commit()
+        self._stats = None
+    
+    def staging_name(self, doc_name: str) -> str:
+        """Name to add a document's new postings under until promote()"""
+        return self.STAGING_PREFIX + doc_name
+    
+    def promote(self, doc_name: str):
+        """Replace a document's postings with its staged ones in one transaction"""
+        with DB_POOL.connect(self.db_path) as conn:
+            self._delete_postings(conn, doc_name)
+            conn.execute("UPDATE bm25_docs SET doc_name = ? WHERE doc_name = ?",
+                         (doc_name, self.staging_name(doc_name)))
+            conn.commit()
+        self._stats = None
+    
+    def discard_staged(self, doc_name: str):
+        """Drop postings staged for a document whose ingest failed"""
+        self.remove_document(self.staging_name(doc_name))
+    
+    def indexed_documents(self) -> set:
+        """Names of documents that have postings"""
+        with DB_POOL.connect(self.db_path) as conn:
+            return {row[0] for row in conn.execute("SELECT DISTINCT doc_name FROM bm25_docs")}
+    
+    def search(self, query: str, k: int = 3) -> List[tuple]:
+        """Top-k (chunk_id, score) pairs by BM25"""
+        terms = set(self.tokenize(query))
+        if not terms:
+            return []
+        
+        with DB_POOL.connect(self.db_path) as conn:
+            if self._stats is None:
+                count, total_length = conn.execute(
+                    "SELECT COUNT(*), SUM(length) FROM bm25_docs WHERE doc_name NOT LIKE ?",
+                    (self.STAGING_PREFIX + "%",)
+                ).fetchone()
+                self._stats = (count, (total_length or 0) / count if count else 0.0)
+            num_chunks, avg_length = self._stats
+            if not num_chunks:
+                return []
+            
+            scores = Counter()
+            for term in terms:
+                rows = conn.execute('''
+                    SELECT p.chunk_id, p.tf, d.length FROM bm25_postings p
+                    JOIN bm25_docs d ON d.chunk_id = p.chunk_id
+                    WHERE p.term = ? AND d.doc_name NOT LIKE ?
+                ''', (term, self.STAGING_PREFIX + "%")).fetchall()
+                if not rows:
+                    continue
+                idf = math.log(1 + (num_chunks - len(rows) + 0.5) / (len(rows) + 0.5))
+                for chunk_id, tf, length in rows:
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (avg_length or 1))
+                    scores[chunk_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores.most_common(k)
+
+
+class TableStore:
+    """Typed copies of extracted tables (PDF tables, Excel sheets, CSV files) for exact lookups
+    
+    Each table is a SQLite table t_<id> with columns c0..cN: REAL when every value parses as a
+    number, TEXT otherwise. table_catalog maps them back to documents, table and header names.
+    Re-extracted tables are written under a staging name and swapped in by promote(), so a
+    failed re-index keeps the tables of the version that stays registered.
+    """
+    
+    STAGING_PREFIX = "staging/"  # Cannot occur in a file name
+    
+    AGGREGATES = [
+        ('max', r"\b(?:max(?:imum)?|highest|largest|biggest|greatest)\b"),
+        ('min', r"\b(?:min(?:imum)?|lowest|smallest|least)\b"),
+        ('avg', r"\b(?:average|avg|mean)\b"),
+        ('sum', r"\b(?:sum|total)\b"),
+        ('count', r"\b(?:how many|count|number of)\b"),
+    ]
+    LOOKUP = re.compile(r"^(?:what(?: is|'s| are)|show(?: me)?|give me|find)\s+the\s+(?P<column>.+?)\s+"
+                        r"(?:of|for)\s+(?P<value>.+?)\s*\??$")
+    TABLE_MENTION = r"\s*\b(?:in|from|on)\s+(?:the\s+)?(?:sheet|table|file|tab)?\s*"
+    # Words that may appear around an aggregate without changing what is asked
+    FILLER_WORDS = {
+        'what', 'whats', 'is', 'are', 'the', 'a', 'an', 'of', 'in', 'from', 'on', 'for', 'value', 'values',
+        'sheet', 'table', 'file', 'tab', 'column', 'which', 'who', 'has', 'have', 'with', 'there', 'rows',
+        'row', 'records', 'record', 'entries', 'entry', 'me', 'show', 'give', 'find', 'tell', 'all', 'overall'
+    }
+    
+    def __init__(self, db_path: str = TABLE_STORE_DB):
+        self.db_path = db_path
+        self.init_store_db()
+    
+    def init_store_db(self):
+        """Create the table catalog"""
+        with DB_POOL.connect(self.db_path) as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS table_catalog (
+                    table_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    doc_name TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    table_name TEXT NOT NULL,
+                    columns TEXT NOT NULL,
+                    row_count INTEGER DEFAULT 0,
+                    UNIQUE (doc_name, table_name)
+                )
+            ''')
+            conn.commit()
+            # Tables staged by an ingest that never finished
+            staged = [row[0] for row in conn.execute(
+                "SELECT DISTINCT doc_name FROM table_catalog WHERE doc_name LIKE ?", (self.STAGING_PREFIX + "%",)
+            ).fetchall()]
+        for doc_name in staged:
+            self.remove_document(doc_name)
+    
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Lowercase with punctuation, underscores and repeated spaces folded to single spaces"""
+        return " ".join(re.sub(r"[^\w.%$]+|_", " ", str(text).lower()).split())
+    
+    @staticmethod
+    def _to_numbers(values: pd.Series) -> pd.Series:
+        """Parse numbers written with thousands separators, currency or percent signs"""
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            return values.astype(float)
+        cleaned = values.astype(str).str.replace(r"[,$%\s]", "", regex=True)
+        return pd.to_numeric(cleaned, errors='coerce').where(values.notna())
+    
+    @staticmethod
+    def _column_names(header) -> List[str]:
+        """Readable, unique header names (blank header cells become 'column N')"""
+        names = []
+        for i, name in enumerate(header):
+            name = " ".join(str(name).split()) if name is not None and not pd.isna(name) else ""
+            name = name if name and not name.startswith("Unnamed:") else f"column {i + 1}"
+            base, n = name, 2
+            while name in names:
+                name, n = f"{base} ({n})", n + 1
+            names.append(name)
+        return names
+    
+    def add_table(self, doc_name: str, source: str, table_name: str, df: pd.DataFrame):
+        """Append rows to a table; the first call for a (document, table) pair fixes its column types"""
+        df = df.replace(r"^\s*$", np.nan, regex=True).dropna(how='all')
+        if df.empty:
+            return
+        with DB_POOL.connect(self.db_path) as conn:
+            row = conn.execute(
+                "SELECT table_id, columns FROM table_catalog WHERE doc_name = ? AND table_name = ?",
+                (doc_name, table_name)
+            ).fetchone()
+            if row is None:
+                columns = [
+                    {'name': name, 'type': 'REAL' if not values.empty and self._to_numbers(values).notna().all() else 'TEXT'}
+                    for name, values in zip(self._column_names(df.columns),
+                                            (df.iloc[:, i].dropna() for i in range(df.shape[1])))
+                ]
+                table_id = conn.execute(
+                    "INSERT INTO table_catalog (doc_name, source, table_name, columns) VALUES (?, ?, ?, ?)",
+                    (doc_name, source, table_name, json.dumps(columns))
+                ).lastrowid
+                definitions = ", ".join(f"c{i} {column['type']}" for i, column in enumerate(columns))
+                conn.execute(f"CREATE TABLE t_{table_id} ({definitions})")
+            else:
+                table_id, columns = row[0], json.loads(row[1])
+            
+            # Cells that do not parse in a REAL column stay as text and are skipped by aggregates
+            data = []
+            for i, column in enumerate(columns):
+                if i >= df.shape[1]:
+                    data.append([None] * len(df))
+                    continue
+                values = df.iloc[:, i]
+                present = values.notna()
+                if column['type'] == 'REAL':
+                    numbers = self._to_numbers(values)
+                    values = numbers.astype(object).where(numbers.notna(), values.astype(str))
+                else:
+                    values = values.astype(str)
+                data.append(values.astype(object).where(present, None).tolist())
+            rows = list(zip(*data))
+            conn.executemany(f"INSERT INTO t_{table_id} VALUES ({', '.join('?' * len(columns))})", rows)
+            conn.execute("UPDATE table_catalog SET row_count = row_count + ? WHERE table_id = ?", (len(rows), table_id))
+            conn.commit()
+    
+    @staticmethod
+    def _drop_tables(conn: sqlite3.Connection, doc_name: str):
+        """Drop a document's tables within the caller's transaction"""
+        table_ids = [row[0] for row in conn.execute(
+            "SELECT table_id FROM table_catalog WHERE doc_name = ?", (doc_name,)
+        ).fetchall()]
+        conn.execute("DELETE FROM table_catalog WHERE doc_name = ?", (doc_name,))
+        for table_id in table_ids:
+            conn.execute(f"DROP TABLE IF EXISTS t_{table_id}")
+    
+    def remove_document(self, doc_name: str):
+        """Drop every table extracted from a document"""
+        with DB_POOL.connect(self.db_path) as conn:
+            self._drop_tables(conn, doc_name)
+            conn.commit()
+    
+    def staging_name(self, doc_name: str) -> str:
+        """Name to add a document's re-extracted tables under until promote()"""
+        return self.STAGING_PREFIX + doc_name
+    
+    def promote(self, doc_name: str):
+        """Replace a document's tables with its staged ones in one transaction"""
+        with DB_POOL.connect(self.db_path) as conn:
+            self._drop_tables(conn, doc_name)
+            conn.execute("UPDATE table_catalog SET doc_name = ? WHERE doc_name = ?",
+                         (doc_name, self.staging_name(doc_name)))
+            conn.commit()
+    
+    def discard_staged(self, doc_name: str):
+        """Drop tables staged for a document whose ingest failed"""
+        self.remove_document(self.staging_name(doc_name))
+    
+    def list_tables(self, doc_names: Optional[set] = None) -> List[Dict]:
+        """Catalog entries, optionally limited to the given documents"""
+        with DB_POOL.connect(self.db_path) as conn:
+            rows = conn.execute(
+                "SELECT table_id, doc_name, source, table_name, columns, row_count FROM table_catalog ORDER BY table_id"
+            ).fetchall()
+        return [
+            {'table_id': table_id, 'doc_name': doc_name, 'source': source, 'table_name': table_name,
+             'columns': json.loads(columns), 'row_count': row_count}
+            for table_id, doc_name, source, table_name, columns, row_count in rows
+            if doc_names is None or doc_name in doc_names
+        ]
+    
+    def get_stats(self) -> Dict[str, int]:
+        """Number of tables and rows in the store"""
+        tables = self.list_tables()
+        return {'tables': len(tables), 'rows': sum(table['row_count'] for table in tables)}
+    
+    @staticmethod
+    def _mentions(text: str, phrase: str) -> bool:
+        return bool(phrase) and re.search(rf"(?<!\w){re.escape(phrase)}(?!\w)", text) is not None
+    
+    @staticmethod
+    def _format_value(value) -> str:
+        if isinstance(value, float):
+            return str(int(value)) if value.is_integer() else f"{value:.6g}"
+        return str(value)
+    
+    @staticmethod
+    def _label(table: Dict) -> str:
+        """Sheet/table name with its document (just the file name for CSV files)"""
+        if table['table_name'] == table['doc_name']:
+            return table['doc_name']
+        return f"{table['table_name']} ({table['doc_name']})"
+    
+    def _describe_row(self, table: Dict, row: tuple) -> str:
+        return ", ".join(f"{column['name']}: {self._format_value(value)}"
+                         for column, value in zip(table['columns'], row) if value is not None)
+    
+    def answer(self, question: str, doc_names: Optional[set] = None) -> Optional[Dict]:
+        """Answer an aggregate ("max price in sheet Sales") or lookup ("what is the price of Widget")
+        question from a single table; None when the question does not map onto one unambiguously"""
+        text = self.normalize(question)
+        tables = self.list_tables(doc_names)
+        if not text or not tables:
+            return None
+        
+        # A named sheet/table/file narrows the candidates
+        named = [t for t in tables if self._mentions(text, self.normalize(t['table_name']))
+                 or self._mentions(text, self.normalize(os.path.splitext(t['doc_name'])[0]))]
+        candidates = named or tables
+        
+        lookup = self.LOOKUP.match(text)
+        if lookup:
+            return self._answer_lookup(lookup.group('column'), lookup.group('value'), candidates)
+        for aggregate, pattern in self.AGGREGATES:
+            if re.search(pattern, text):
+                return self._answer_aggregate(aggregate, pattern, text, candidates)
+        return None
+    
+    def _match_column(self, text: str, tables: List[Dict], numeric: bool) -> Optional[tuple]:
+        """(table, column index) of the longest column name mentioned in text, if exactly one table has it"""
+        best_length, matches = 0, []
+        for table in tables:
+            for i, column in enumerate(table['columns']):
+                name = self.normalize(column['name'])
+                if len(name) < 2 or (numeric and column['type'] != 'REAL') or not self._mentions(text, name):
+                    continue
+                if len(name) > best_length:
+                    best_length, matches = len(name), [(table, i)]
+                elif len(name) == best_length:
+                    matches.append((table, i))
+        return matches[0] if len(matches) == 1 else None
+    
+    def _leftover_words(self, text: str, pattern: str, table: Dict) -> set:
+        """Words of the question not explained by the aggregate, the table or its column names"""
+        known = set(self.FILLER_WORDS)
+        known.update(self.normalize(table['table_name']).split())
+        known.update(self.normalize(os.path.splitext(table['doc_name'])[0]).split())
+        for column in table['columns']:
+            known.update(self.normalize(column['name']).split())
+        return set(re.sub(pattern, " ", text).split()) - known
+    
+    def _answer_aggregate(self, aggregate: str, pattern: str, text: str, tables: List[Dict]) -> Optional[Dict]:
+        match = self._match_column(text, tables, numeric=aggregate != 'count')
+        if match is None:
+            if aggregate != 'count' or len(tables) != 1:
+                return None
+            match = (tables[0], None)
+        table, index = match
+        # Anything else in the question (a filter, a condition) is left to the LLM
+        if self._leftover_words(text, pattern, table):
+            return None
+        
+        label = self._label(table)
+        with DB_POOL.connect(self.db_path) as conn:
+            if index is None:
+                count = conn.execute(f"SELECT COUNT(*) FROM t_{table['table_id']}").fetchone()[0]
+                answer = f"{label} has {count} rows."
+            else:
+                column = f"c{index}"
+                name = table['columns'][index]['name']
+                is_number = f"typeof({column}) IN ('integer', 'real')"
+                if aggregate in ('max', 'min'):
+                    row = conn.execute(
+                        f"SELECT * FROM t_{table['table_id']} WHERE {is_number} "
+                        f"ORDER BY {column} {'DESC' if aggregate == 'max' else 'ASC'} LIMIT 1"
+                    ).fetchone()
+                    if row is None:
+                        return None
+                    answer = (f"The {'maximum' if aggregate == 'max' else 'minimum'} {name} in {label} is "
+                              f"{self._format_value(row[index])} ({self._describe_row(table, row)}).")
+                elif aggregate == 'count':
+                    count = conn.execute(
+                        f"SELECT COUNT({column}) FROM t_{table['table_id']}"
+                    ).fetchone()[0]
+                    answer = f"{label} has {count} non-empty {name} values."
+                else:
+                    value, count = conn.execute(
+                        f"SELECT {aggregate.upper()}({column}), COUNT({column}) FROM t_{table['table_id']} WHERE {is_number}"
+                    ).fetchone()
+                    if not count:
+                        return None
+                    answer = (f"The {'average' if aggregate == 'avg' else 'total'} {name} in {label} is "
+                              f"{self._format_value(float(value))} over {count} rows.")
+        return {'answer': answer, 'source_files': [table['source']], 'table': table['table_name']}
+    
+    def _answer_lookup(self, column_text: str, value_text: str, tables: List[Dict]) -> Optional[Dict]:
+        # "... of Widget in sheet Products": the table mention is not part of the looked-up value
+        for table in tables:
+            for phrase in (table['table_name'], os.path.splitext(table['doc_name'])[0]):
+                value_text = re.sub(self.TABLE_MENTION + re.escape(self.normalize(phrase)) + r"$", "", value_text)
+        value_text = value_text.strip()
+        
+        name_matches = [(table, i) for table in tables for i, column in enumerate(table['columns'])
+                        if self.normalize(column['name']) == column_text]
+        if not value_text or len(name_matches) != 1:
+            return None
+        table, index = name_matches[0]
+        text_columns = [f"c{i}" for i, column in enumerate(table['columns'])
+                        if column['type'] == 'TEXT' and i != index]
+        if not text_columns:
+            return None
+        
+        with DB_POOL.connect(self.db_path) as conn:
+            rows = conn.execute(
+                f"SELECT * FROM t_{table['table_id']} WHERE "
+                + " OR ".join(f"lower(trim({column})) = ?" for column in text_columns)
+                + f" LIMIT {STRUCTURED_MAX_ROWS + 1}",
+                [value_text] * len(text_columns)
+            ).fetchall()
+        rows = [row for row in rows if row[index] is not None]
+        if not rows:
+            return None
+        
+        name = table['columns'][index]['name']
+        label = self._label(table)
+        if len(rows) == 1:
+            # Quote the key as written in the table rather than the normalized question
+            key = next((value for value in rows[0] if isinstance(value, str) and value.strip().lower() == value_text),
+                       value_text)
+            answer = f"The {name} for {key} in {label} is {self._format_value(rows[0][index])}."
+        else:
+            answer = f"{len(rows) if len(rows) <= STRUCTURED_MAX_ROWS else 'Several'} rows in {label} match {value_text}:\n"
+            answer += "\n".join(f"- {self._describe_row(table, row)}" for row in rows[:STRUCTURED_MAX_ROWS])
+        return {'answer': answer, 'source_files': [table['source']], 'table': table['table_name']}
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that persists chunk vectors keyed by (embed model, chunk text hash)
+    and keeps question vectors in a byte-bounded LRU backed by a row-bounded persistent table"""
+    
+    LOOKUP_BATCH = 500  # Stay below SQLite's bound-parameter limit
+    QUERY_PRUNE_EVERY = 256  # Persisted question vectors between prunes of the persistent tier
+    
+    def __init__(self, embeddings: Embeddings, model_name: str, db_path: str = EMBED_CACHE_DB,
+                 query_cache_bytes: Optional[int] = None, persist_queries: Optional[bool] = None,
+                 query_cache_rows: Optional[int] = None):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+        
+        # Query vectors are cached separately: models may embed queries and documents differently
+        self.query_cache_bytes = QUERY_EMBED_CACHE_MAX_BYTES if query_cache_bytes is None else query_cache_bytes
+        self.persist_queries = PERSIST_QUERY_EMBEDDINGS if persist_queries is None else persist_queries
+        self.query_cache_rows = QUERY_EMBED_CACHE_MAX_ROWS if query_cache_rows is None else query_cache_rows
+        self._query_cache = OrderedDict()  # text_hash -> float32 vector, most recently used last
+        self._query_cache_used = 0
+        self._query_lock = threading.Lock()
+        self.query_memory_hits = 0
+        self.query_disk_hits = 0
+        self.query_misses = 0
+        self.query_evictions = 0
+        self.query_disk_evictions = 0
+        self._query_stores = 0  # Question vectors persisted since the last prune
+        self.init_cache_db()
+        if self.persist_queries:
+            self._prune_queries()
+    
+    def init_cache_db(self):
+        """Initialize SQLite database for cached embeddings"""
+        with DB_POOL.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS embedding_cache (
+                    model TEXT,
+                    text_hash TEXT,
+                    vector BLOB,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (model, text_hash)
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS query_embedding_cache (
+                    model TEXT,
+                    text_hash TEXT,
+                    vector BLOB,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (model, text_hash)
+                )
+            ''')
+            # last_used orders the persistent question tier for pruning; older databases are migrated in place
+            cursor.execute("PRAGMA table_info(query_embedding_cache)")
+            if 'last_used' not in {row[1] for row in cursor.fetchall()}:
+                cursor.execute("ALTER TABLE query_embedding_cache ADD COLUMN last_used DATETIME")
+                cursor.execute("UPDATE query_embedding_cache SET last_used = timestamp")
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_query_embedding_cache_last_used ON query_embedding_cache (last_used)"
+            )
+            conn.commit()
+    
+    @staticmethod
+    def get_text_hash(text: str) -> str:
+        """Generate hash for chunk text to use as cache key"""
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+    
+    def _lookup(self, text_hashes: List[str]) -> Dict[str, List[float]]:
+        """Fetch cached vectors for the given hashes"""
+        found = {}
+        with DB_POOL.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            try:
+                for i in range(0, len(text_hashes), self.LOOKUP_BATCH):
+                    batch = text_hashes[i:i + self.LOOKUP_BATCH]
+                    placeholders = ",".join("?" * len(batch))
+                    cursor.execute(f'''
+                        SELECT text_hash, vector FROM embedding_cache
+                        WHERE model = ? AND text_hash IN ({placeholders})
+                    ''', (self.model_name, *batch))
+                    for text_hash, vector in cursor.fetchall():
+                        found[text_hash] = np.frombuffer(vector, dtype=np.float32).tolist()
+            except Exception as e:
+                logger.error(f"Error reading embedding cache: {e}")
+        return found
+    
+    def _store(self, vectors: Dict[str, List[float]]):
+        """Persist newly computed vectors"""
+        with DB_POOL.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.executemany('''
+                    INSERT OR REPLACE INTO embedding_cache (model, text_hash, vector)
+                    VALUES (?, ?, ?)
+                ''', [
+                    (self.model_name, text_hash, np.asarray(vector, dtype=np.float32).tobytes())
+                    for text_hash, vector in vectors.items()
+                ])
+                conn.commit()
+            except Exception as e:
+                logger.error(f"Error writing embedding cache: {e}")
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed chunks, calling the underlying model only for texts not seen before"""
+        text_hashes = [self.get_text_hash(text) for text in texts]
+        vectors = self._lookup(list(set(text_hashes)))
+        
+        # Deduplicate misses so repeated boilerplate is embedded once
+        missing = {}
+        for text_hash, text in zip(text_hashes, texts):
+            if text_hash not in vectors:
+                missing.setdefault(text_hash, text)
+        
+        if missing:
+            missing_hashes = list(missing)
+            new_vectors = self.embeddings.embed_documents([missing[h] for h in missing_hashes])
+            computed = dict(zip(missing_hashes, new_vectors))
+            self._store(computed)
+            vectors.update(computed)
+        
+        with self._stats_lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        return [vectors[text_hash] for text_hash in text_hashes]
+    
+    @staticmethod
+    def normalize_query(text: str) -> str:
+        """Collapse whitespace so trivially different spellings of a question share a vector"""
+        return " ".join(text.split())
+    
+    def _remember_query(self, text_hash: str, vector: np.ndarray):
+        """Insert into the in-process LRU, evicting least recently used vectors over budget"""
+        with self._query_lock:
+            if text_hash in self._query_cache:
+                self._query_cache.move_to_end(text_hash)
+                return
+            if vector.nbytes > self.query_cache_bytes:
+                return
+            self._query_cache[text_hash] = vector
+            self._query_cache_used += vector.nbytes
+            while self._query_cache_used > self.query_cache_bytes:
+                _, evicted = self._query_cache.popitem(last=False)
+                self._query_cache_used -= evicted.nbytes
+                self.query_evictions += 1
+    
+    def _lookup_query(self, text_hash: str) -> Optional[np.ndarray]:
+        """Fetch a persisted question vector and mark it as recently used"""
+        with DB_POOL.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute('''
+                    SELECT vector FROM query_embedding_cache WHERE model = ? AND text_hash = ?
+                ''', (self.model_name, text_hash))
+                row = cursor.fetchone()
+                if row is None:
+                    return None
+                cursor.execute('''
+                    UPDATE query_embedding_cache SET last_used = strftime('%Y-%m-%d %H:%M:%f', 'now')
+                    WHERE model = ? AND text_hash = ?
+                ''', (self.model_name, text_hash))
+                conn.commit()
+                return np.frombuffer(row[0], dtype=np.float32)
+            except Exception as e:
+                logger.error(f"Error reading query embedding cache: {e}")
+                return None
+    
+    def _store_query(self, text_hash: str, vector: np.ndarray):
+        """Persist a newly computed question vector"""
+        with DB_POOL.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute('''
+                    INSERT OR REPLACE INTO query_embedding_cache (model, text_hash, vector, last_used)
+                    VALUES (?, ?, ?, strftime('%Y-%m-%d %H:%M:%f', 'now'))
+                ''', (self.model_name, text_hash, vector.tobytes()))
+                conn.commit()
+            except Exception as e:
+                logger.error(f"Error writing query embedding cache: {e}")
+                return
+        with self._query_lock:
+            self._query_stores += 1
+            due = self._query_stores >= self.QUERY_PRUNE_EVERY
+        if due:
+            self._prune_queries()
+    
+    def _prune_queries(self) -> int:
+        """Delete the least recently used persisted question vectors beyond query_cache_rows"""
+        with self._query_lock:
+            self._query_stores = 0
+        with DB_POOL.connect(self.db_path) as conn:
+            try:
+                deleted = conn.execute('''
+                    DELETE FROM query_embedding_cache WHERE rowid IN (
+                        SELECT rowid FROM query_embedding_cache ORDER BY last_used DESC, rowid DESC LIMIT -1 OFFSET ?
                     )
-                    documents.append(col_doc)
-                    
-        except Exception as e:
-            logger.error(f"Error loading Excel file {self.file_path}: {e}")
+                ''', (self.query_cache_rows,)).rowcount
+                conn.commit()
+            except Exception as e:
+                logger.error(f"Error pruning query embedding cache: {e}")
+                return 0
+        with self._query_lock:
+            self.query_disk_evictions += deleted
+        return deleted
+    
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a question, checking the in-process LRU, then the persistent tier, then the model"""
+        text_hash = self.get_text_hash(self.normalize_query(text))
+        with self._query_lock:
+            vector = self._query_cache.get(text_hash)
+            if vector is not None:
+                self._query_cache.move_to_end(text_hash)
+                self.query_memory_hits += 1
+                return vector.tolist()
         
-        return documents
+        vector = self._lookup_query(text_hash) if self.persist_queries else None
+        if vector is not None:
+            with self._query_lock:
+                self.query_disk_hits += 1
+        else:
+            vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+            with self._query_lock:
+                self.query_misses += 1
+            if self.persist_queries:
+                self._store_query(text_hash, vector)
+        self._remember_query(text_hash, vector)
+        return vector.tolist()
+    
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several questions; distinct uncached ones are sent to the model concurrently"""
+        unique = list(dict.fromkeys(texts))
+        if len(unique) == 1:
+            vectors = {unique[0]: self.embed_query(unique[0])}
+        else:
+            # Each question goes through embed_query, so model-specific query instructions still apply
+            with ThreadPoolExecutor(max_workers=min(EMBED_MAX_WORKERS, len(unique))) as executor:
+                vectors = dict(zip(unique, executor.map(self.embed_query, unique)))
+        return [vectors[text] for text in texts]
+    
+    def get_query_cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and memory use of the question-vector cache"""
+        with self._query_lock:
+            lookups = self.query_memory_hits + self.query_disk_hits + self.query_misses
+            return {
+                "entries": len(self._query_cache),
+                "bytes": self._query_cache_used,
+                "max_bytes": self.query_cache_bytes,
+                "memory_hits": self.query_memory_hits,
+                "disk_hits": self.query_disk_hits,
+                "misses": self.query_misses,
+                "evictions": self.query_evictions,
+                "persisted_max_rows": self.query_cache_rows,
+                "disk_evictions": self.query_disk_evictions,
+                "hit_rate": (self.query_memory_hits + self.query_disk_hits) / lookups if lookups else 0.0
+            }
+
+
+class SemanticAnswerIndex:
+    """In-memory inner-product index over normalized question embeddings of cached answers"""
+    
+    def __init__(self):
+        self.index = None
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def normalize(vector) -> np.ndarray:
+        """Unit-length float32 row so inner product equals cosine similarity"""
+        vector = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+    
+    def rebuild(self, rows: List[tuple]):
+        """Build from (answer id, question embedding blob) rows"""
+        with self._lock:
+            self.index = None
+            ids, vectors = [], []
+            for answer_id, blob in rows:
+                vector = np.frombuffer(blob, dtype=np.float32)
+                if vectors and len(vector) != len(vectors[0]):
+                    continue  # Embedded by a model with another dimension
+                ids.append(answer_id)
+                vectors.append(vector)
+            if vectors:
+                self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(len(vectors[0])))
+                self.index.add_with_ids(np.vstack(vectors), np.asarray(ids, dtype=np.int64))
+    
+    def add(self, answer_id: int, vector):
+        """Index one cached question"""
+        vector = self.normalize(vector)
+        with self._lock:
+            if self.index is None:
+                self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(vector.shape[1]))
+            if vector.shape[1] == self.index.d:
+                self.index.add_with_ids(vector, np.asarray([answer_id], dtype=np.int64))
+    
+    def remove(self, answer_ids: List[int]):
+        """Drop cached questions from the index"""
+        with self._lock:
+            if self.index is not None and answer_ids:
+                self.index.remove_ids(np.asarray(answer_ids, dtype=np.int64))
+    
+    def search(self, vector) -> Optional[tuple]:
+        """Nearest cached question as (answer id, cosine similarity)"""
+        vector = self.normalize(vector)
+        with self._lock:
+            if self.index is None or self.index.ntotal == 0 or vector.shape[1] != self.index.d:
+                return None
+            scores, ids = self.index.search(vector, 1)
+        if ids[0][0] < 0:
+            return None
+        return int(ids[0][0]), float(scores[0][0])
+
+
+class StubEmbeddings(Embeddings):
+    """Deterministic offline embedder for benchmarking ingestion without an embedding server"""
+    
+    def __init__(self, dimensions: int = 1024, latency: float = 0.0):
+        self.dimensions = dimensions
+        self.latency = latency  # Simulated round-trip time per request
+    
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+        vector = np.random.default_rng(seed).standard_normal(self.dimensions).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+    
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class EmbeddingPipeline:
+    """Embeds chunks in fixed-size batches with several requests in flight
+    
+    Each batch is one embed_documents call, which OllamaEmbeddings sends as a single
+    multi-input /api/embed request.
+    """
+    
+    def __init__(self, embeddings: Embeddings, batch_size: int = EMBED_BATCH_SIZE,
+                 max_workers: int = EMBED_MAX_WORKERS):
+        self.embeddings = embeddings
+        self.batch_size = max(1, batch_size)
+        self.max_workers = max(1, max_workers)
+        self.last_stats = {}
+        self.total_chunks = 0
+        self.total_time = 0.0
+    
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts in order, batching and overlapping requests to the backend"""
+        start_time = time.time()
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        
+        if self.max_workers == 1 or len(batches) <= 1:
+            results = [self.embeddings.embed_documents(batch) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+                results = list(executor.map(self.embeddings.embed_documents, batches))
+        
+        vectors = [vector for batch_vectors in results for vector in batch_vectors]
+        elapsed = time.time() - start_time
+        self.total_chunks += len(texts)
+        self.total_time += elapsed
+        self.last_stats = {
+            'chunks': len(texts),
+            'batches': len(batches),
+            'seconds': elapsed,
+            'chunks_per_sec': len(texts) / elapsed if elapsed > 0 else 0.0
+        }
+        logger.info(f"Embedded {len(texts)} chunks in {len(batches)} batches "
+                    f"({self.last_stats['chunks_per_sec']:.1f} chunks/sec)")
+        return vectors
+    
+    def get_stats(self) -> Dict:
+        """Throughput over the lifetime of the pipeline"""
+        return {
+            'batch_size': self.batch_size,
+            'max_workers': self.max_workers,
+            'total_chunks': self.total_chunks,
+            'chunks_per_sec': self.total_chunks / self.total_time if self.total_time > 0 else 0.0,
+            'last': self.last_stats
+        }
 
 
 class KnowledgeBaseManager:
     """Manages multiple documents in the knowledge base"""
     
-    def __init__(self):
+    def __init__(self, incremental: bool = True, lazy: bool = LAZY_STARTUP):
         os.makedirs(KNOWLEDGE_BASE_DIR, exist_ok=True)
-        self.embeddings = OllamaEmbeddings(model=EMBED_MODEL)
+        # Searches share the read lock; index changes take the write lock. Ingestion and scans hold
+        # the ingest lock throughout and the write lock only while publishing their results
+        self.rw_lock = ReadWriteLock()
+        self.ingest_lock = threading.RLock()
+        self.embeddings = CachedEmbeddings(OllamaEmbeddings(model=EMBED_MODEL), EMBED_MODEL_ID)
+        self.embedding_pipeline = EmbeddingPipeline(self.embeddings)
+        self.chunk_store = SQLiteChunkStore()
+        self.bm25_index = BM25Index()
+        self._bm25_checked = False
+        self.table_store = TableStore()
         self.documents = {}
         self.combined_vectordb = None
+        # When incremental, new documents are appended to the in-memory combined
+        # store and only recorded as deltas; combined_vs is rewritten on compaction.
+        self.incremental = incremental
+        self.combined_manifest = self._empty_combined_manifest()
+        # When lazy, combined_vs is opened on first search instead of in the constructor
+        self.lazy = lazy
+        self._combined_synced = False
+        self._combined_mmapped = False
+        # IVF search breadth; kept here so set_nprobe survives reloads and backend rebuilds
+        self.nprobe = IVF_NPROBE
+        self.last_scan_changes = {'added': [], 'modified': [], 'deleted': []}
+        # Paraphrased questions are matched on their embeddings; the index is filled on first lookup
+        self.semantic_index = SemanticAnswerIndex()
+        self._semantic_loaded = False
+        self.answer_cache_stats = {'exact_hits': 0, 'semantic_hits': 0, 'misses': 0, 'time_saved': 0.0,
+                                   'invalidated': 0, 'pruned': 0}
+        # Row count of cached_answers, maintained on insert/delete so status reads skip COUNT(*);
+        # recounted on every prune to pick up rows other processes added or deleted
+        self._cache_size = 0
+        self._cache_size_lock = threading.Lock()
         self.init_cache_db()
+        self.log_writer = AsyncLogWriter(CACHE_DB)
         self.load_existing_documents()
+        self._prune_stop = threading.Event()
+        self._prune_thread = None
+        if ANSWER_CACHE_PRUNE_INTERVAL > 0:
+            self.start_cache_pruning()
         
     def init_cache_db(self):
         """Initialize SQLite database for caching answers"""
-        conn = sqlite3.connect(CACHE_DB)
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS cached_answers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                question_hash TEXT UNIQUE,
-                question TEXT,
-                answer TEXT,
-                context TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                source_files TEXT
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS debug_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                operation TEXT,
-                details TEXT,
-                execution_time REAL
-            )
-        ''')
-        conn.commit()
-        conn.close()
+        with DB_POOL.connect(CACHE_DB) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS cached_answers (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    question_hash TEXT UNIQUE,
+                    question TEXT,
+                    answer TEXT,
+                    context TEXT,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    source_files TEXT
+                )
+            ''')
+            # Columns added for the semantic cache; older databases are migrated in place
+            cursor.execute("PRAGMA table_info(cached_answers)")
+            columns = {row[1] for row in cursor.fetchall()}
+            if 'question_embedding' not in columns:
+                cursor.execute("ALTER TABLE cached_answers ADD COLUMN question_embedding BLOB")
+            if 'generation_time' not in columns:
+                cursor.execute("ALTER TABLE cached_answers ADD COLUMN generation_time REAL")
+            # Version stamps: answers are only served while their sources and models are unchanged
+            for column, column_type in (('doc_versions', 'TEXT'), ('answer_model', 'TEXT'),
+                                        ('embed_model', 'TEXT'), ('last_accessed', 'DATETIME')):
+                if column not in columns:
+                    cursor.execute(f"ALTER TABLE cached_answers ADD COLUMN {column} {column_type}")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_cached_answers_last_accessed ON cached_answers (last_accessed)")
+            cursor.execute("SELECT COUNT(*) FROM cached_answers")
+            self._cache_size = cursor.fetchone()[0]
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS debug_logs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    operation TEXT,
+                    details TEXT,
+                    execution_time REAL
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS document_manifest (
+                    doc_name TEXT PRIMARY KEY,
+                    path TEXT,
+                    doc_type TEXT,
+                    size INTEGER,
+                    mtime REAL,
+                    content_hash TEXT,
+                    chunks INTEGER,
+                    embed_model TEXT,
+                    added_at TEXT
+                )
+            ''')
+            conn.commit()
         
     def get_question_hash(self, question: str) -> str:
         """Generate hash for question to use as cache key"""
         return hashlib.md5(question.lower().strip().encode()).hexdigest()
     
-    def cache_answer(self, question: str, answer: str, context: str, source_files: List[str]):
-        """Cache answer for future use"""
+    def cache_answer(self, question: str, answer: str, context: str, source_files: List[str],
+                     question_vector: Optional[List[float]] = None, generation_time: Optional[float] = None):
+        """Cache answer for future use, with the question embedding for semantic lookups"""
         question_hash = self.get_question_hash(question)
-        conn = sqlite3.connect(CACHE_DB)
-        cursor = conn.cursor()
-        try:
-            cursor.execute('''
-                INSERT OR REPLACE INTO cached_answers 
-                (question_hash, question, answer, context, source_files)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (question_hash, question, answer, context, json.dumps(source_files)))
-            conn.commit()
-            logger.info(f"Cached answer for question: {question[:50]}...")
-        except Exception as e:
-            logger.error(f"Error caching answer: {e}")
-        finally:
-            conn.close()
+        embedding = SemanticAnswerIndex.normalize(question_vector).tobytes() if question_vector is not None else None
+        doc_versions = self._current_versions(source_files)
+        with DB_POOL.connect(CACHE_DB) as conn:
+            cursor = conn.cursor()
+            try:
+                # One write transaction, so another writer can't insert the same question between the check and the insert
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute("SELECT id FROM cached_answers WHERE question_hash = ?", (question_hash,))
+                replaced = [row[0] for row in cursor.fetchall()]
+                cursor.execute('''
+                    INSERT OR REPLACE INTO cached_answers 
+                    (question_hash, question, answer, context, source_files, question_embedding, generation_time,
+                     doc_versions, answer_model, embed_model, last_accessed)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ''', (question_hash, question, answer, context, json.dumps(source_files), embedding, generation_time,
+                      json.dumps(doc_versions), ANSWER_MODEL, EMBED_MODEL_ID))
+                answer_id = cursor.lastrowid
+                conn.commit()
+                if not replaced:
+                    with self._cache_size_lock:
+                        self._cache_size += 1
+                if self._semantic_loaded:
+                    self.semantic_index.remove(replaced)
+                    if question_vector is not None:
+                        self.semantic_index.add(answer_id, question_vector)
+                logger.info(f"Cached answer for question: {question[:50]}...")
+            except Exception as e:
+                logger.error(f"Error caching answer: {e}")
     
-    def get_cached_answer(self, question: str) -> Optional[Dict]:
-        """Retrieve cached answer if available"""
-        question_hash = self.get_question_hash(question)
-        conn = sqlite3.connect(CACHE_DB)
-        cursor = conn.cursor()
-        try:
-            cursor.execute('''
-                SELECT question, answer, context, source_files, timestamp
-                FROM cached_answers WHERE question_hash = ?
-            ''', (question_hash,))
-            result = cursor.fetchone()
-            if result:
-                return {
-                    'question': result[0],
-                    'answer': result[1],
-                    'context': result[2],
-                    'source_files': json.loads(result[3]),
-                    'timestamp': result[4]
-                }
-        except Exception as e:
-            logger.error(f"Error retrieving cached answer: {e}")
-        finally:
-            conn.close()
+    def _load_semantic_index(self):
+        """Index the embeddings of every cached question"""
+        with DB_POOL.connect(CACHE_DB) as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT id, question_embedding FROM cached_answers WHERE question_embedding IS NOT NULL")
+                self.semantic_index.rebuild(cursor.fetchall())
+                self._semantic_loaded = True
+            except Exception as e:
+                logger.error(f"Error loading semantic answer cache: {e}")
+    
+    def _current_versions(self, source_files: List[str]) -> Dict[str, Optional[str]]:
+        """Content hash each source file is currently indexed at"""
+        with self.rw_lock.read():
+            versions = {info['path']: info.get('content_hash') for info in self.documents.values()}
+        return {source: versions.get(source) for source in source_files}
+    
+    def _is_current(self, cached: Dict) -> bool:
+        """Whether a cached answer was built from the current documents and models"""
+        if cached['answer_model'] != ANSWER_MODEL or cached['embed_model'] != EMBED_MODEL_ID:
+            return False
+        if cached['doc_versions'] is None:
+            return False  # Cached before answers were stamped
+        return cached['doc_versions'] == self._current_versions(list(cached['doc_versions']))
+    
+    def _fetch_cached_answer(self, where: str, params: tuple) -> Optional[Dict]:
+        """Read one unexpired cached_answers row and mark it as recently used"""
+        with DB_POOL.connect(CACHE_DB) as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(f'''
+                    SELECT id, question, answer, context, source_files, timestamp, generation_time,
+                           doc_versions, answer_model, embed_model
+                    FROM cached_answers WHERE {where} AND timestamp >= datetime('now', ?)
+                ''', (*params, f"-{ANSWER_CACHE_TTL_SECONDS} seconds"))
+                result = cursor.fetchone()
+                if result:
+                    cursor.execute("UPDATE cached_answers SET last_accessed = CURRENT_TIMESTAMP WHERE id = ?",
+                                   (result[0],))
+                    conn.commit()
+                    return {
+                        'id': result[0],
+                        'question': result[1],
+                        'answer': result[2],
+                        'context': result[3],
+                        'source_files': json.loads(result[4]),
+                        'timestamp': result[5],
+                        'generation_time': result[6],
+                        'doc_versions': json.loads(result[7]) if result[7] else None,
+                        'answer_model': result[8],
+                        'embed_model': result[9]
+                    }
+            except Exception as e:
+                logger.error(f"Error retrieving cached answer: {e}")
         return None
     
+    def _delete_cached_answers(self, answer_ids: List[int]) -> int:
+        """Delete cached answers by id and drop them from the semantic index"""
+        if not answer_ids:
+            return 0
+        with DB_POOL.connect(CACHE_DB) as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.executemany("DELETE FROM cached_answers WHERE id = ?", [(answer_id,) for answer_id in answer_ids])
+                deleted = cursor.rowcount
+                conn.commit()
+            except Exception as e:
+                logger.error(f"Error deleting cached answers: {e}")
+                return 0
+        with self._cache_size_lock:
+            self._cache_size = max(0, self._cache_size - deleted)
+        self.semantic_index.remove(answer_ids)
+        return deleted
+    
+    def get_cache_size(self) -> int:
+        """Number of cached answers"""
+        return self._cache_size
+    
+    def invalidate_cached_answers(self, source: str) -> int:
+        """Delete cached answers built from a source file that was re-indexed or removed"""
+        with DB_POOL.connect(CACHE_DB) as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute('''
+                    SELECT DISTINCT cached_answers.id FROM cached_answers, json_each(cached_answers.source_files)
+                    WHERE json_each.value = ?
+                ''', (source,))
+                answer_ids = [row[0] for row in cursor.fetchall()]
+            except Exception as e:
+                logger.error(f"Error finding cached answers for {source}: {e}")
+                return 0
+        removed = self._delete_cached_answers(answer_ids)
+        if removed:
+            self.answer_cache_stats['invalidated'] += removed
+            logger.info(f"Invalidated {removed} cached answers built from {source}")
+        return removed
+    
+    def prune_answer_cache(self) -> int:
+        """Delete expired answers and the least recently used ones beyond ANSWER_CACHE_MAX_ENTRIES"""
+        with DB_POOL.connect(CACHE_DB) as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT id FROM cached_answers WHERE timestamp < datetime('now', ?)",
+                               (f"-{ANSWER_CACHE_TTL_SECONDS} seconds",))
+                answer_ids = {row[0] for row in cursor.fetchall()}
+                cursor.execute('''
+                    SELECT id FROM cached_answers
+                    ORDER BY COALESCE(last_accessed, timestamp) DESC, id DESC
+                    LIMIT -1 OFFSET ?
+                ''', (ANSWER_CACHE_MAX_ENTRIES,))
+                answer_ids.update(row[0] for row in cursor.fetchall())
+            except Exception as e:
+                logger.error(f"Error pruning answer cache: {e}")
+                return 0
+        removed = self._delete_cached_answers(sorted(answer_ids))
+        if removed:
+            self.answer_cache_stats['pruned'] += removed
+            logger.info(f"Pruned {removed} expired or least recently used cached answers")
+        self._recount_cache_size()
+        return removed
+    
+    def _recount_cache_size(self):
+        """Reset the cached row count from the database"""
+        with DB_POOL.connect(CACHE_DB) as conn:
+            try:
+                count = conn.execute("SELECT COUNT(*) FROM cached_answers").fetchone()[0]
+            except Exception as e:
+                logger.error(f"Error counting cached answers: {e}")
+                return
+        with self._cache_size_lock:
+            self._cache_size = count
+    
+    def start_cache_pruning(self, interval: float = ANSWER_CACHE_PRUNE_INTERVAL):
+        """Prune the answer cache now and then every interval seconds on a daemon thread"""
+        if self._prune_thread and self._prune_thread.is_alive():
+            return
+        self._prune_stop.clear()
+        
+        def prune_loop():
+            while True:
+                try:
+                    self.prune_answer_cache()
+                except Exception as e:
+                    logger.error(f"Error in answer cache pruning thread: {e}")
+                if self._prune_stop.wait(interval):
+                    break
+        
+        self._prune_thread = threading.Thread(target=prune_loop, name="answer-cache-pruner", daemon=True)
+        self._prune_thread.start()
+    
+    def stop_cache_pruning(self):
+        """Stop the background pruning thread"""
+        self._prune_stop.set()
+        if self._prune_thread:
+            self._prune_thread.join(timeout=5)
+            self._prune_thread = None
+    
+    def get_cached_answer(self, question: str, question_vector: Optional[List[float]] = None) -> Optional[Dict]:
+        """Retrieve cached answer by exact question, then by nearest cached question embedding"""
+        start_time = time.time()
+        cached = self._fetch_cached_answer("question_hash = ?", (self.get_question_hash(question),))
+        if cached:
+            cached['match'] = 'exact'
+            cached['similarity'] = 1.0
+        elif question_vector is not None and SEMANTIC_CACHE_ENABLED:
+            if not self._semantic_loaded:
+                self._load_semantic_index()
+            nearest = self.semantic_index.search(question_vector)
+            if nearest and nearest[1] >= SEMANTIC_CACHE_THRESHOLD:
+                cached = self._fetch_cached_answer("id = ?", (nearest[0],))
+                if cached:
+                    cached['match'] = 'semantic'
+                    cached['similarity'] = nearest[1]
+        
+        # Sources edited behind our back (or a model switch) make the entry stale
+        if cached and not self._is_current(cached):
+            self.answer_cache_stats['invalidated'] += self._delete_cached_answers([cached['id']])
+            cached = None
+        
+        if cached:
+            self.answer_cache_stats[f"{cached['match']}_hits"] += 1
+            if cached['generation_time']:
+                self.answer_cache_stats['time_saved'] += max(0.0, cached['generation_time'] - (time.time() - start_time))
+        else:
+            self.answer_cache_stats['misses'] += 1
+        return cached
+    
+    def get_answer_cache_stats(self) -> Dict[str, Any]:
+        """Exact/semantic hit counts, hit rate and estimated generation time saved"""
+        stats = dict(self.answer_cache_stats)
+        lookups = stats['exact_hits'] + stats['semantic_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['exact_hits'] + stats['semantic_hits']) / lookups if lookups else 0.0
+        stats['threshold'] = SEMANTIC_CACHE_THRESHOLD
+        stats['ttl_seconds'] = ANSWER_CACHE_TTL_SECONDS
+        stats['max_entries'] = ANSWER_CACHE_MAX_ENTRIES
+        return stats
+    
     def log_operation(self, operation: str, details: str, execution_time: float):
-        """Log operations for debugging"""
-        conn = sqlite3.connect(CACHE_DB)
-        cursor = conn.cursor()
-        try:
-            cursor.execute('''
-                INSERT INTO debug_logs (operation, details, execution_time)
-                VALUES (?, ?, ?)
-            ''', (operation, details, execution_time))
-            conn.commit()
-        except Exception as e:
-            logger.error(f"Error logging operation: {e}")
-        finally:
-            conn.close()
+        """Log operations for debugging (queued; written by the background log writer)"""
+        self.log_writer.log(operation, details, execution_time)
+    
+    @staticmethod
+    def get_file_hash(file_path: str) -> str:
+        """Content hash of a source file, used to detect real edits behind mtime changes"""
+        sha = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(block)
+        return sha.hexdigest()
+    
+    def _load_manifest(self) -> Dict[str, Dict]:
+        """Read the document manifest (one row per indexed source file)"""
+        with DB_POOL.connect(CACHE_DB) as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            try:
+                cursor.execute("SELECT * FROM document_manifest")
+                return {row['doc_name']: dict(row) for row in cursor.fetchall()}
+            except Exception as e:
+                logger.error(f"Error reading document manifest: {e}")
+                return {}
+    
+    def _update_manifest(self, doc_name: str, file_path: str, doc_type: str, chunks: int,
+                         added_at: str, content_hash: Optional[str] = None):
+        """Record the size, mtime and content hash a document was indexed from"""
+        stat = os.stat(file_path)
+        with DB_POOL.connect(CACHE_DB) as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute('''
+                    INSERT OR REPLACE INTO document_manifest
+                    (doc_name, path, doc_type, size, mtime, content_hash, chunks, embed_model, added_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (doc_name, file_path, doc_type, stat.st_size, stat.st_mtime,
+                      content_hash or self.get_file_hash(file_path), chunks, EMBED_MODEL_ID, added_at))
+                conn.commit()
+            except Exception as e:
+                logger.error(f"Error updating document manifest: {e}")
     
+    def _delete_manifest_entry(self, doc_name: str):
+        """Forget a document in the manifest"""
+        with DB_POOL.connect(CACHE_DB) as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("DELETE FROM document_manifest WHERE doc_name = ?", (doc_name,))
+                conn.commit()
+            except Exception as e:
+                logger.error(f"Error updating document manifest: {e}")
+    
+    @ingest_locked
     def add_document(self, file_path: str, doc_type: str = "pdf") -> bool:
-        """Add a document to the knowledge base"""
+        """Add a document to the knowledge base
+        
+        Searches keep running while the document is parsed and embedded; the write lock is
+        held only to register it and update the combined store.
+        """
         start_time = time.time()
+        doc_name = os.path.basename(file_path)
         try:
-            # Use enhanced loaders for PDF and Excel
-            if doc_type == "pdf":
-                loader = EnhancedPDFLoader(file_path)
-            elif doc_type == "xlsx" or doc_type == "excel":
-                loader = EnhancedExcelLoader(file_path)
-            elif doc_type == "txt":
-                loader = TextLoader(file_path)
-            elif doc_type == "csv":
-                loader = CSVLoader(file_path)
-            else:
-                raise ValueError(f"Unsupported document type: {doc_type}")
+            # Create vector store for this document (unchanged chunks come from the embedding cache)
+            misses_before = self.embeddings.misses
+            vectordb, chunk_count, embed_time = self._stream_document_store(file_path, doc_type)
+            embedded = self.embeddings.misses - misses_before
+            content_hash = self.get_file_hash(file_path)
             
-            docs = loader.load()
-            splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=150)
-            chunks = splitter.split_documents(docs)
+            with self.rw_lock.write():
+                self._register_document_store(file_path, doc_type, vectordb, chunk_count, content_hash)
+                
+                # Update combined vector store
+                if self.incremental:
+                    self._append_to_combined_vectordb(doc_name, vectordb)
+                else:
+                    self._rebuild_combined_vectordb()
             
-            # Create vector store for this document
-            doc_name = os.path.basename(file_path)
-            vectordb = FAISS.from_documents(chunks, self.embeddings)
+            execution_time = time.time() - start_time
+            self.log_operation(
+                "add_document",
+                f"Added {doc_name} ({doc_type}), embedded {embedded}/{chunk_count} chunks, "
+                f"{chunk_count / embed_time if embed_time > 0 else 0.0:.1f} chunks/sec",
+                execution_time
+            )
+            logger.info(f"Successfully added document: {doc_name} ({chunk_count - embedded} chunks from embedding cache)")
+            return True
             
-            # Save individual document vector store
-            db_path = os.path.join(KNOWLEDGE_BASE_DIR, f"vs_{doc_name}")
-            vectordb.save_local(db_path)
+        except Exception as e:
+            # The previous version (if any) stays registered, and so do its postings and tables
+            self.bm25_index.discard_staged(doc_name)
+            self.table_store.discard_staged(doc_name)
+            execution_time = time.time() - start_time
+            self.log_operation("add_document_error", str(e), execution_time)
+            logger.error(f"Error adding document {file_path}: {e}")
+            return False
+    
+    def _stream_document_store(self, file_path: str, doc_type: str) -> tuple:
+        """Parse, embed and index a document INGEST_STREAM_BATCH chunks at a time
+        
+        Chunks go to the chunk store and staged BM25 postings as each batch is embedded, so only
+        one batch of pages, chunks and vectors is held at once. Nothing searches can see changes
+        until _register_document_store. Returns (store, chunks, embed seconds).
+        """
+        doc_name = os.path.basename(file_path)
+        self.bm25_index.discard_staged(doc_name)
+        self.table_store.discard_staged(doc_name)
+        vectordb = None
+        chunk_count = 0
+        embed_time = 0.0
+        batch = []
+        chunks = iter_document_chunks(file_path, doc_type, functools.partial(
+            self.table_store.add_table, self.table_store.staging_name(doc_name), file_path
+        ))
+        while True:
+            chunk = next(chunks, None)
+            if chunk is not None:
+                batch.append(chunk)
+                if len(batch) < INGEST_STREAM_BATCH:
+                    continue
+            if not batch:
+                break
+            embed_start = time.time()
+            vectors = self.embedding_pipeline.embed([doc.page_content for doc in batch])
+            embed_time += time.time() - embed_start
+            if vectordb is None:
+                vectordb = FAISS(self.embeddings, faiss.IndexFlatL2(len(vectors[0])), self.chunk_store, {})
+            self._add_chunk_batch(vectordb, doc_name, batch, vectors)
+            chunk_count += len(batch)
+            batch = []
+        
+        if vectordb is None:
+            raise ValueError(f"No text could be extracted from {doc_name}")
+        return vectordb, chunk_count, embed_time
+    
+    def _add_chunk_batch(self, vectordb: FAISS, doc_name: str, chunks: List[Document],
+                         vectors: List[List[float]]):
+        """Append embedded chunks to a document store and its staged BM25 postings"""
+        texts = [chunk.page_content for chunk in chunks]
+        chunk_ids = vectordb.add_embeddings(
+            list(zip(texts, vectors)),
+            metadatas=[chunk.metadata for chunk in chunks]
+        )
+        self.bm25_index.add_chunks(self.bm25_index.staging_name(doc_name), dict(zip(chunk_ids, texts)))
+    
+    def _build_document_store(self, file_path: str, chunks: List[Document], vectors: List[List[float]]) -> FAISS:
+        """Build the individual vector store of one document, with staged postings, ready to register"""
+        doc_name = os.path.basename(file_path)
+        vectordb = FAISS(self.embeddings, faiss.IndexFlatL2(len(vectors[0])), self.chunk_store, {})
+        self.bm25_index.discard_staged(doc_name)
+        self._add_chunk_batch(vectordb, doc_name, chunks, vectors)
+        return vectordb
+    
+    def _stage_tables(self, file_path: str, tables: List[tuple]):
+        """Stage a document's freshly extracted tables; _register_document_store swaps them in"""
+        doc_name = os.path.basename(file_path)
+        staging_name = self.table_store.staging_name(doc_name)
+        self.table_store.discard_staged(doc_name)
+        try:
+            for table_name, df in tables:
+                self.table_store.add_table(staging_name, file_path, table_name, df)
+        except Exception:
+            self.table_store.discard_staged(doc_name)
+            raise
+    
+    @ingest_locked
+    def rebuild_table_store(self) -> int:
+        """Re-extract the tables of every PDF, Excel and CSV document (e.g. ones indexed before the table store)"""
+        start_time = time.time()
+        rebuilt = 0
+        for doc_name, doc_info in list(self.documents.items()):
+            file_path = resolve_data_path(doc_info['path'])
+            if doc_info['type'] not in ("pdf", "xlsx", "excel", "csv") or not os.path.exists(file_path):
+                continue
+            try:
+                self.table_store.discard_staged(doc_name)
+                extract_document_tables(file_path, doc_info['type'], functools.partial(
+                    self.table_store.add_table, self.table_store.staging_name(doc_name), doc_info['path']
+                ))
+                with self.rw_lock.write():
+                    self.table_store.promote(doc_name)
+                rebuilt += 1
+            except Exception as e:
+                self.table_store.discard_staged(doc_name)
+                logger.error(f"Error extracting tables from {doc_name}: {e}")
+        self.log_operation("rebuild_table_store", f"Extracted tables from {rebuilt} documents", time.time() - start_time)
+        return rebuilt
+    
+    def answer_from_tables(self, question: str) -> Optional[Dict]:
+        """Exact answer to an aggregate or lookup question about one table, or None"""
+        if not STRUCTURED_QUERIES_ENABLED:
+            return None
+        try:
+            with self.rw_lock.read():
+                doc_names = set(self.documents)
+            return self.table_store.answer(question, doc_names)
+        except Exception as e:
+            logger.error(f"Error answering from table store: {e}")
+            return None
+    
+    def _register_document_store(self, file_path: str, doc_type: str, vectordb: FAISS, chunk_count: int,
+                                 content_hash: str):
+        """Save a finished document store, swap in its staged postings and tables and record it
+        in the manifest (caller holds the write lock)"""
+        doc_name = os.path.basename(file_path)
+        
+        # Save individual document vector store
+        db_path = os.path.join(KNOWLEDGE_BASE_DIR, f"vs_{doc_name}")
+        self._save_vector_store(vectordb, db_path)
+        self.bm25_index.promote(doc_name)
+        self.table_store.promote(doc_name)
+        
+        self.documents[doc_name] = {
+            'path': file_path,
+            'type': doc_type,
+            'db_path': db_path,
+            'chunks': chunk_count,
+            'added_at': datetime.now().isoformat(),
+            'content_hash': content_hash
+        }
+        self._update_manifest(doc_name, file_path, doc_type, chunk_count,
+                              self.documents[doc_name]['added_at'], content_hash)
+        self.invalidate_cached_answers(file_path)
+    
+    @ingest_locked
+    @write_locked
+    def remove_document(self, doc_name: str) -> bool:
+        """Remove a document from the combined store, its vector store and the manifest"""
+        start_time = time.time()
+        try:
+            if self.incremental:
+                if self.combined_vectordb is None:
+                    self._load_combined_vectordb()
+                if doc_name in self._combined_members():
+                    self._remove_from_combined_vectordb(doc_name)
+                    self._save_combined_manifest()
             
-            self.documents[doc_name] = {
-                'path': file_path,
-                'type': doc_type,
-                'db_path': db_path,
-                'chunks': len(chunks),
-                'added_at': datetime.now().isoformat()
-            }
+            db_path = os.path.join(KNOWLEDGE_BASE_DIR, f"vs_{doc_name}")
+            if os.path.isdir(db_path):
+                shutil.rmtree(db_path)
+            self.chunk_store.delete_store(f"vs_{doc_name}")
+            self.bm25_index.remove_document(doc_name)
+            self.table_store.remove_document(doc_name)
+            removed = self.documents.pop(doc_name, None)
+            self._delete_manifest_entry(doc_name)
+            if removed:
+                self.invalidate_cached_answers(removed['path'])
             
-            # Rebuild combined vector store
-            self._rebuild_combined_vectordb()
+            if not self.incremental:
+                self._rebuild_combined_vectordb()
             
-            execution_time = time.time() - start_time
-            self.log_operation("add_document", f"Added {doc_name} ({doc_type})", execution_time)
-            logger.info(f"Successfully added document: {doc_name}")
+            self.log_operation("remove_document", f"Removed {doc_name}", time.time() - start_time)
+            logger.info(f"Removed document: {doc_name}")
             return True
+        except Exception as e:
+            logger.error(f"Error removing document {doc_name}: {e}")
+            return False
+    
+    @ingest_locked
+    def bulk_add_documents(self, file_paths: List[str], max_workers: int = INGEST_MAX_WORKERS) -> int:
+        """Add many documents: parse in a process pool, embed in one pipeline, build the combined store once
+        
+        Only registering the documents and building the combined store take the write lock.
+        """
+        start_time = time.time()
+        
+        # Parsing (pdfplumber / pandas) is CPU-bound, so fan out across processes
+        parsed = {}
+        with _process_pool(max(1, min(max_workers, len(file_paths)))) as executor:
+            futures = {
+                executor.submit(load_split_and_extract_tables, file_path, get_doc_type(file_path)): file_path
+                for file_path in file_paths
+            }
+            for future in as_completed(futures):
+                file_path = futures[future]
+                try:
+                    parsed[file_path] = future.result()
+                except Exception as e:
+                    self.log_operation("add_document_error", f"{file_path}: {e}", 0.0)
+                    logger.error(f"Error parsing document {file_path}: {e}")
+        parse_time = time.time() - start_time
+        
+        ordered = [(file_path, parsed[file_path][0]) for file_path in file_paths if parsed.get(file_path, ([],))[0]]
+        if not ordered:
+            return 0
+        
+        # One embedding pass over every chunk of every document; if the embedder is down nothing is
+        # registered, so the next scan picks these files up again
+        misses_before = self.embeddings.misses
+        try:
+            vectors = self.embedding_pipeline.embed(
+                [chunk.page_content for _, chunks in ordered for chunk in chunks]
+            )
+        except Exception as e:
+            self.log_operation("add_document_error", f"Embedding {len(ordered)} documents: {e}",
+                               time.time() - start_time)
+            logger.error(f"Error embedding {len(ordered)} documents: {e}")
+            return 0
+        embedded = self.embeddings.misses - misses_before
+        
+        built = []
+        offset = 0
+        for file_path, chunks in ordered:
+            try:
+                vectordb = self._build_document_store(file_path, chunks, vectors[offset:offset + len(chunks)])
+                self._stage_tables(file_path, parsed[file_path][1])
+                built.append((file_path, vectordb, len(chunks), self.get_file_hash(file_path)))
+            except Exception as e:
+                self.bm25_index.discard_staged(os.path.basename(file_path))
+                logger.error(f"Error building vector store for {file_path}: {e}")
+            offset += len(chunks)
+        
+        with self.rw_lock.write():
+            new_stores = []
+            for file_path, vectordb, chunk_count, content_hash in built:
+                try:
+                    self._register_document_store(file_path, get_doc_type(file_path), vectordb, chunk_count,
+                                                  content_hash)
+                    new_stores.append((os.path.basename(file_path), vectordb))
+                except Exception as e:
+                    self.bm25_index.discard_staged(os.path.basename(file_path))
+                    self.table_store.discard_staged(os.path.basename(file_path))
+                    logger.error(f"Error saving vector store for {file_path}: {e}")
             
-        except Exception as e:
-            execution_time = time.time() - start_time
-            self.log_operation("add_document_error", str(e), execution_time)
-            logger.error(f"Error adding document {file_path}: {e}")
-            return False
+            # Build the combined store once at the end
+            if self.incremental:
+                self._merge_into_combined_vectordb(new_stores)
+            else:
+                self._rebuild_combined_vectordb()
+        
+        total_chunks = sum(len(chunks) for _, chunks in ordered)
+        execution_time = time.time() - start_time
+        self.log_operation(
+            "bulk_add_documents",
+            f"Added {len(new_stores)} documents, {total_chunks} chunks (embedded {embedded}), "
+            f"parse {parse_time:.2f}s, {self.embedding_pipeline.last_stats['chunks_per_sec']:.1f} chunks/sec",
+            execution_time
+        )
+        logger.info(f"Bulk-added {len(new_stores)} documents ({total_chunks} chunks) in {execution_time:.2f}s")
+        return len(new_stores)
     
     def _rebuild_combined_vectordb(self):
         """Rebuild combined vector database with all documents"""
+        self._combined_synced = True
         try:
             all_vectordbs = []
             for doc_name, doc_info in self.documents.items():
                 if os.path.exists(doc_info['db_path']):
-                    vectordb = FAISS.load_local(
-                        doc_info['db_path'],
-                        self.embeddings,
-                        allow_dangerous_deserialization=True
-                    )
-                    all_vectordbs.append(vectordb)
+                    vectordb = self._load_vector_store(doc_info['db_path'])
+                    all_vectordbs.append((doc_name, vectordb))
             
+            self.combined_vectordb = None
+            self._combined_mmapped = False
+            self.combined_manifest = self._empty_combined_manifest()
             if all_vectordbs:
-                self.combined_vectordb = all_vectordbs[0]
-                for vectordb in all_vectordbs[1:]:
-                    self.combined_vectordb.merge_from(vectordb)
+                self.combined_vectordb = all_vectordbs[0][1]
+                for doc_name, vectordb in all_vectordbs[1:]:
+                    self._merge_store_into_combined(vectordb)
+                self._apply_index_backend()
                 
                 # Save combined vector store
-                combined_path = os.path.join(KNOWLEDGE_BASE_DIR, "combined_vs")
-                self.combined_vectordb.save_local(combined_path)
+                self._save_combined_store()
+                self.combined_manifest['base'] = [doc_name for doc_name, _ in all_vectordbs]
+                self._garbage_collect_chunks()
                 logger.info("Successfully rebuilt combined vector database")
+            self._save_combined_manifest()
             
         except Exception as e:
+            # Don't keep a half-built store whose vectors the manifest doesn't list; the next sync starts over
+            self.combined_vectordb = None
+            self._combined_mmapped = False
+            self.combined_manifest = self._empty_combined_manifest()
+            self._combined_synced = False
             logger.error(f"Error rebuilding combined vector database: {e}")
     
-    def load_existing_documents(self):
-        """Automatically scan and load documents from knowledge base folder"""
-        supported_extensions = ['*.pdf', '*.txt', '*.csv', '*.xlsx', '*.xls']
+    def _garbage_collect_chunks(self):
+        """Delete unreferenced chunks, unless an ingest on another thread has chunks no saved index references yet"""
+        if self.ingest_lock.acquire(blocking=False):
+            try:
+                self.chunk_store.garbage_collect()
+            finally:
+                self.ingest_lock.release()
+    
+    @write_locked
+    def rebuild_combined_vectordb(self):
+        """Force a full rebuild of the combined vector database from every document store"""
+        start_time = time.time()
+        self._rebuild_combined_vectordb()
+        self.log_operation("rebuild_combined", f"Rebuilt from {len(self.documents)} documents", time.time() - start_time)
+    
+    @staticmethod
+    def _empty_combined_manifest() -> Dict:
+        """Manifest layout for combined_vs: docs in the saved index, appended docs, docs dropped since"""
+        return {'base': [], 'deltas': [], 'removed': []}
+    
+    def _combined_members(self) -> set:
+        """Document names currently represented in the combined vector database"""
+        manifest = self.combined_manifest
+        return (set(manifest['base']) - set(manifest['removed'])) | set(manifest['deltas'])
+    
+    def _save_vector_store(self, vectordb: FAISS, folder: str, store: Optional[str] = None):
+        """Write the FAISS index to disk and its position -> chunk id map to the chunk store"""
+        os.makedirs(folder, exist_ok=True)
+        faiss.write_index(vectordb.index, os.path.join(folder, "index.faiss"))
+        self.chunk_store.save_id_map(store or os.path.basename(folder), vectordb.index_to_docstore_id)
+        legacy_docstore = os.path.join(folder, "index.pkl")
+        if os.path.exists(legacy_docstore):
+            os.remove(legacy_docstore)
+    
+    def _load_vector_store(self, folder: str, io_flags: int = 0) -> FAISS:
+        """Open a saved vector store; stores with a pickled docstore are migrated to the chunk store once"""
+        store = os.path.basename(folder)
+        index_to_docstore_id = self.chunk_store.load_id_map(store)
+        if index_to_docstore_id is None:
+            legacy = FAISS.load_local(folder, self.embeddings, allow_dangerous_deserialization=True)
+            self.chunk_store.add({
+                doc_id: legacy.docstore.search(doc_id) for doc_id in legacy.index_to_docstore_id.values()
+            })
+            self.chunk_store.save_id_map(store, legacy.index_to_docstore_id)
+            os.remove(os.path.join(folder, "index.pkl"))
+            index_to_docstore_id = legacy.index_to_docstore_id
+            logger.info(f"Migrated {store} from pickled docstore to chunk store")
+        
+        index = faiss.read_index(os.path.join(folder, "index.faiss"), io_flags)
+        return FAISS(self.embeddings, index, self.chunk_store, index_to_docstore_id)
+    
+    def _save_combined_store(self):
+        """Write combined_vs via a temporary folder so a memory-mapped index is never truncated in place"""
+        tmp_dir = COMBINED_VS_DIR + ".tmp"
+        self._save_vector_store(self.combined_vectordb, tmp_dir, store=os.path.basename(COMBINED_VS_DIR))
+        os.makedirs(COMBINED_VS_DIR, exist_ok=True)
+        for file_name in os.listdir(tmp_dir):
+            os.replace(os.path.join(tmp_dir, file_name), os.path.join(COMBINED_VS_DIR, file_name))
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        legacy_docstore = os.path.join(COMBINED_VS_DIR, "index.pkl")
+        if os.path.exists(legacy_docstore):
+            os.remove(legacy_docstore)
+    
+    def _save_combined_manifest(self):
+        """Persist the combined_vs manifest atomically"""
+        os.makedirs(COMBINED_VS_DIR, exist_ok=True)
+        manifest_path = os.path.join(COMBINED_VS_DIR, COMBINED_MANIFEST_FILE)
+        tmp_path = manifest_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.combined_manifest, f, indent=2)
+        os.replace(tmp_path, manifest_path)
+    
+    def _load_combined_vectordb(self) -> bool:
+        """Load the persisted combined_vs and replay the deltas recorded since the last compaction"""
+        manifest_path = os.path.join(COMBINED_VS_DIR, COMBINED_MANIFEST_FILE)
+        if not os.path.exists(manifest_path) or not os.path.exists(os.path.join(COMBINED_VS_DIR, "index.faiss")):
+            return False
+        
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            # IO_FLAG_MMAP_IFC maps flat codes and IVF lists; older faiss only maps IVF lists with IO_FLAG_MMAP
+            io_flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) if MMAP_COMBINED_INDEX else 0
+            combined = self._load_vector_store(COMBINED_VS_DIR, io_flags=io_flags)
+        except Exception as e:
+            logger.error(f"Error loading combined vector database: {e}")
+            return False
+        
+        configure_index(combined.index, self.nprobe)
+        self.combined_vectordb = combined
+        self._combined_mmapped = bool(io_flags) and (
+            io_flags != faiss.IO_FLAG_MMAP or faiss.try_extract_index_ivf(combined.index) is not None
+        )
+        self.combined_manifest = {key: list(manifest.get(key, [])) for key in ('base', 'deltas', 'removed')}
+        
+        # Drop documents that were replaced or removed after the base was written
+        for doc_name in set(self.combined_manifest['removed']) | set(self.combined_manifest['deltas']):
+            self._delete_combined_vectors(doc_name)
+        
+        # Replay appended documents from their individual stores
+        for doc_name in list(self.combined_manifest['deltas']):
+            db_path = os.path.join(KNOWLEDGE_BASE_DIR, f"vs_{doc_name}")
+            try:
+                vectordb = self._load_vector_store(db_path)
+                self._merge_store_into_combined(vectordb)
+            except Exception as e:
+                logger.error(f"Error replaying delta {doc_name}: {e}")
+                self.combined_manifest['deltas'].remove(doc_name)
+        
+        logger.info(f"Loaded combined vector database ({len(self.combined_manifest['deltas'])} deltas)")
+        return True
+    
+    def _delete_combined_vectors(self, doc_name: str) -> int:
+        """Delete every vector of a document from the in-memory combined store"""
+        if self.combined_vectordb is None:
+            return 0
+        doc_chunk_ids = set(self.chunk_store.get_chunk_ids(doc_name))
+        positions = [
+            pos for pos, doc_id in self.combined_vectordb.index_to_docstore_id.items()
+            if doc_id in doc_chunk_ids
+        ]
+        if not positions:
+            return 0
+        
+        self._ensure_writable_combined()
+        if faiss.try_extract_index_ivf(self.combined_vectordb.index) is None:
+            self.combined_vectordb.delete([self.combined_vectordb.index_to_docstore_id[pos] for pos in positions])
+        else:
+            # IVF remove_ids keeps the remaining ids, so drop positions instead of renumbering
+            self.combined_vectordb.index.remove_ids(np.array(positions, dtype=np.int64))
+            for pos in positions:
+                del self.combined_vectordb.index_to_docstore_id[pos]
+        return len(positions)
+    
+    def _ensure_writable_combined(self):
+        """Reopen a memory-mapped index in RAM before adding or removing vectors; mapped codes are read-only"""
+        if not self._combined_mmapped:
+            return
+        self._combined_mmapped = False
+        index = faiss.read_index(os.path.join(COMBINED_VS_DIR, "index.faiss"))
+        configure_index(index, self.nprobe)
+        self.combined_vectordb.index = index
+    
+    def _merge_store_into_combined(self, vectordb: FAISS):
+        """Append a (flat) document store to the combined store, whatever the combined backend
+        
+        Both stores share the chunk store, so only vectors and position -> id entries are copied.
+        """
+        self._ensure_writable_combined()
+        combined = self.combined_vectordb
+        num_vectors = vectordb.index.ntotal
+        vectors = vectordb.index.reconstruct_n(0, num_vectors)
+        doc_ids = [vectordb.index_to_docstore_id[i] for i in range(num_vectors)]
         
-        for extension in supported_extensions:
-            pattern = os.path.join(KNOWLEDGE_BASE_DIR, extension)
-            files = glob.glob(pattern)
+        if faiss.try_extract_index_ivf(combined.index) is None:
+            start = combined.index.ntotal
+            combined.index.add(vectors)
+            positions = range(start, start + num_vectors)
+        else:
+            next_id = max(combined.index_to_docstore_id, default=-1) + 1
+            positions = np.arange(next_id, next_id + num_vectors, dtype=np.int64)
+            combined.index.add_with_ids(vectors, positions)
+            positions = positions.tolist()
+        combined.index_to_docstore_id.update(zip(positions, doc_ids))
+    
+    def _apply_index_backend(self):
+        """Convert a flat combined index to the configured IVF backend once it is large enough"""
+        index = self.combined_vectordb.index
+        if (INDEX_BACKEND == "flat" or faiss.try_extract_index_ivf(index) is not None
+                or index.ntotal < IVF_MIN_VECTORS):
+            return
+        start_time = time.time()
+        # Positions must be contiguous so the trained index can reuse them as ids
+        id_map = self.combined_vectordb.index_to_docstore_id
+        new_index = build_backend_index(index.reconstruct_n(0, index.ntotal))
+        configure_index(new_index, self.nprobe)
+        self.combined_vectordb.index_to_docstore_id = {i: id_map[pos] for i, pos in enumerate(sorted(id_map))}
+        self.combined_vectordb.index = new_index
+        self._combined_mmapped = False
+        logger.info(f"Built {INDEX_BACKEND} combined index over {index.ntotal} vectors in {time.time() - start_time:.2f}s")
+    
+    @write_locked
+    def set_nprobe(self, nprobe: int):
+        """Tune the recall/latency trade-off of an IVF combined index at runtime"""
+        self.nprobe = nprobe
+        if self.combined_vectordb is not None:
+            configure_index(self.combined_vectordb.index, nprobe)
+    
+    def _remove_from_combined_vectordb(self, doc_name: str):
+        """Remove a document from the combined store and record it in the manifest"""
+        self._delete_combined_vectors(doc_name)
+        manifest = self.combined_manifest
+        if doc_name in manifest['base'] and doc_name not in manifest['removed']:
+            manifest['removed'].append(doc_name)
+        if doc_name in manifest['deltas']:
+            manifest['deltas'].remove(doc_name)
+    
+    def _append_to_combined_vectordb(self, doc_name: str, vectordb: FAISS):
+        """Append one document's vectors to the combined store and persist only the delta"""
+        try:
+            if self.combined_vectordb is None:
+                self._load_combined_vectordb()
             
-            for file_path in files:
-                doc_name = os.path.basename(file_path)
-                db_path = os.path.join(KNOWLEDGE_BASE_DIR, f"vs_{doc_name}")
+            if doc_name in self._combined_members():
+                self._remove_from_combined_vectordb(doc_name)
+            
+            if self.combined_vectordb is None:
+                # First document: it becomes the base of combined_vs
+                self.combined_vectordb = vectordb
+                self.combined_manifest = self._empty_combined_manifest()
+                self.combined_manifest['base'] = [doc_name]
+                self.compact_combined_vectordb()
+                return
+            
+            self._merge_store_into_combined(vectordb)
+            # The document's own vs_<doc> store is the persisted delta
+            self.combined_manifest['deltas'].append(doc_name)
+            self._save_combined_manifest()
+            logger.info(f"Appended {doc_name} to combined vector database")
+            
+            if len(self.combined_manifest['deltas']) >= COMBINED_COMPACT_THRESHOLD:
+                self.compact_combined_vectordb()
                 
-                # Check if document is already processed
-                if doc_name not in self.documents and not os.path.exists(db_path):
-                    file_ext = os.path.splitext(file_path)[1].lower()
-                    doc_type = {'.pdf': 'pdf', '.txt': 'txt', '.csv': 'csv', '.xlsx': 'xlsx', '.xls': 'xlsx'}.get(file_ext, 'txt')
-                    
-                    logger.info(f"Auto-loading document: {doc_name}")
-                    self.add_document(file_path, doc_type)
-                elif doc_name not in self.documents and os.path.exists(db_path):
-                    # Document was processed before, just add to registry
-                    file_ext = os.path.splitext(file_path)[1].lower()
-                    doc_type = {'.pdf': 'pdf', '.txt': 'txt', '.csv': 'csv', '.xlsx': 'xlsx', '.xls': 'xlsx'}.get(file_ext, 'txt')
-                    
-                    # Count chunks by loading the vector store
+        except Exception as e:
+            logger.error(f"Error appending {doc_name} to combined vector database, rebuilding: {e}")
+            self._rebuild_combined_vectordb()
+    
+    def _merge_into_combined_vectordb(self, new_stores: List[tuple]):
+        """Merge several new document stores in memory and write combined_vs once"""
+        try:
+            if self.combined_vectordb is None:
+                self._load_combined_vectordb()
+            
+            for doc_name, vectordb in new_stores:
+                if doc_name in self._combined_members():
+                    self._remove_from_combined_vectordb(doc_name)
+                if self.combined_vectordb is None:
+                    self.combined_vectordb = vectordb
+                else:
+                    self._merge_store_into_combined(vectordb)
+                self.combined_manifest['deltas'].append(doc_name)
+            
+            self.compact_combined_vectordb()
+        except Exception as e:
+            logger.error(f"Error merging new documents into combined vector database, rebuilding: {e}")
+            self._rebuild_combined_vectordb()
+    
+    def _sync_combined_vectordb(self):
+        """Bring the combined store in line with the registered documents"""
+        self._combined_synced = True
+        if self.combined_vectordb is None and not self._load_combined_vectordb():
+            self._rebuild_combined_vectordb()
+            return
+        
+        members = self._combined_members()
+        changed = False
+        for doc_name in members - set(self.documents):
+            self._remove_from_combined_vectordb(doc_name)
+            changed = True
+        for doc_name in set(self.documents) - members:
+            try:
+                vectordb = self._load_vector_store(self.documents[doc_name]['db_path'])
+            except Exception as e:
+                logger.error(f"Error loading vector store for {doc_name}: {e}")
+                continue
+            self._append_to_combined_vectordb(doc_name, vectordb)
+        if changed:
+            self._save_combined_manifest()
+    
+    @write_locked
+    def ensure_combined_vectordb(self):
+        """Open the combined store on first use when startup was lazy"""
+        if self._combined_synced or not self.documents:
+            return
+        start_time = time.time()
+        self._sync_combined_vectordb()
+        execution_time = time.time() - start_time
+        self.log_operation("load_combined", f"Loaded combined vector database for {len(self.documents)} documents", execution_time)
+        logger.info(f"Loaded combined vector database in {execution_time:.2f}s")
+    
+    @write_locked
+    def compact_combined_vectordb(self):
+        """Rewrite combined_vs from the in-memory store and fold all deltas into the base"""
+        if self.combined_vectordb is None:
+            return
+        start_time = time.time()
+        try:
+            members = sorted(self._combined_members())
+            self._apply_index_backend()
+            self._save_combined_store()
+            self.combined_manifest = self._empty_combined_manifest()
+            self.combined_manifest['base'] = members
+            self._save_combined_manifest()
+            self._garbage_collect_chunks()
+            execution_time = time.time() - start_time
+            self.log_operation("compact_combined", f"Compacted {len(members)} documents", execution_time)
+            logger.info(f"Compacted combined vector database in {execution_time:.2f}s")
+        except Exception as e:
+            logger.error(f"Error compacting combined vector database: {e}")
+    
+    def _list_document_files(self) -> List[str]:
+        """Source files in the knowledge base folder"""
+        files = []
+        for extension in SUPPORTED_DOC_TYPES:
+            pattern = os.path.join(KNOWLEDGE_BASE_DIR, f"*{extension}")
+            # vs_<doc> store directories also match the extension patterns
+            files.extend(f for f in glob.glob(pattern) if os.path.isfile(f))
+        return files
+    
+    def _register_from_manifest(self, entry: Dict):
+        """Register an indexed document without opening its vector store"""
+        self.documents[entry['doc_name']] = {
+            'path': entry['path'],
+            'type': entry['doc_type'],
+            'db_path': os.path.join(KNOWLEDGE_BASE_DIR, f"vs_{entry['doc_name']}"),
+            'chunks': entry['chunks'],
+            'added_at': entry['added_at'],
+            'content_hash': entry.get('content_hash'),
+            'auto_loaded': True
+        }
+    
+    @ingest_locked
+    def load_existing_documents(self, bulk: bool = True) -> Dict[str, List[str]]:
+        """Automatically scan and load documents from knowledge base folder
+        
+        Files are compared with the manifest by size and mtime; only files whose stat changed
+        are hashed. Added and modified files are (re)indexed, deleted files are removed.
+        Documents added from outside the folder are checked at their own path. Searches keep
+        running during the scan; the write lock is taken per change.
+        """
+        manifest = self._load_manifest()
+        changes = {'added': [], 'modified': [], 'deleted': []}
+        to_index = []
+        to_register = []  # Unchanged manifest entries not registered yet
+        seen = set()
+        
+        file_paths = self._list_document_files()
+        folder_names = {os.path.basename(file_path) for file_path in file_paths}
+        known_paths = {doc_name: entry['path'] for doc_name, entry in manifest.items()}
+        known_paths.update((doc_name, doc_info['path']) for doc_name, doc_info in self.documents.items())
+        file_paths += [resolve_data_path(path) for doc_name, path in known_paths.items()
+                       if doc_name not in folder_names and os.path.isfile(resolve_data_path(path))]
+        
+        for file_path in file_paths:
+            doc_name = os.path.basename(file_path)
+            db_path = os.path.join(KNOWLEDGE_BASE_DIR, f"vs_{doc_name}")
+            seen.add(doc_name)
+            entry = manifest.get(doc_name)
+            
+            if entry is None:
+                if os.path.exists(db_path):
+                    # Indexed before the manifest existed: count chunks once and record it
                     try:
-                        vectordb = FAISS.load_local(
-                            db_path,
-                            self.embeddings,
-                            allow_dangerous_deserialization=True
-                        )
+                        vectordb = self._load_vector_store(db_path)
                         chunk_count = vectordb.index.ntotal if hasattr(vectordb.index, 'ntotal') else 0
                     except:
                         chunk_count = 0
-                    
-                    self.documents[doc_name] = {
+                    entry = {
+                        'doc_name': doc_name,
                         'path': file_path,
-                        'type': doc_type,
-                        'db_path': db_path,
+                        'doc_type': get_doc_type(file_path),
                         'chunks': chunk_count,
                         'added_at': datetime.fromtimestamp(os.path.getctime(file_path)).isoformat(),
-                        'auto_loaded': True
+                        'content_hash': self.get_file_hash(file_path)
                     }
+                    self._update_manifest(doc_name, file_path, entry['doc_type'], chunk_count, entry['added_at'],
+                                          entry['content_hash'])
+                    to_register.append(entry)
                     logger.info(f"Registered existing document: {doc_name}")
+                else:
+                    changes['added'].append(doc_name)
+                    to_index.append(file_path)
+                continue
+            
+            stat = os.stat(file_path)
+            if entry['embed_model'] != EMBED_MODEL_ID or not os.path.exists(db_path):
+                changes['modified'].append(doc_name)
+                to_index.append(file_path)
+            elif entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+                if doc_name not in self.documents:
+                    to_register.append(entry)
+            else:
+                content_hash = self.get_file_hash(file_path)
+                if content_hash == entry['content_hash']:
+                    # Touched but not edited: refresh stat so the next scan skips hashing
+                    self._update_manifest(doc_name, file_path, entry['doc_type'], entry['chunks'],
+                                          entry['added_at'], content_hash)
+                    if doc_name not in self.documents:
+                        to_register.append(entry)
+                else:
+                    changes['modified'].append(doc_name)
+                    to_index.append(file_path)
+        
+        if to_register:
+            with self.rw_lock.write():
+                for entry in to_register:
+                    self._register_from_manifest(entry)
         
-        # Rebuild combined vector store if we have documents
+        for doc_name in (set(manifest) | set(self.documents)) - seen:
+            changes['deleted'].append(doc_name)
+            self.remove_document(doc_name)
+        
+        if bulk and len(to_index) >= BULK_INGEST_MIN_FILES:
+            logger.info(f"Bulk-loading {len(to_index)} new or modified documents")
+            self.bulk_add_documents(to_index)
+        else:
+            for file_path in to_index:
+                logger.info(f"Auto-loading document: {os.path.basename(file_path)}")
+                self.add_document(file_path, get_doc_type(file_path))
+        
+        # Bring combined vector store up to date if we have documents
         if self.documents:
-            self._rebuild_combined_vectordb()
+            with self.rw_lock.write():
+                if not self.incremental:
+                    self._rebuild_combined_vectordb()
+                elif self.lazy and not self._combined_synced and self.combined_vectordb is None:
+                    logger.info("Deferring combined vector database load until first search")
+                else:
+                    self._sync_combined_vectordb()
             logger.info(f"Auto-loaded {len(self.documents)} documents from knowledge base folder")
+        
+        if any(changes.values()):
+            logger.info(f"Knowledge base changes: {len(changes['added'])} added, "
+                        f"{len(changes['modified'])} modified, {len(changes['deleted'])} deleted")
+        self.last_scan_changes = changes
+        return changes
     
-    def scan_for_new_documents(self):
-        """Scan for new documents added to the folder"""
-        old_count = len(self.documents)
-        self.load_existing_documents()
-        new_count = len(self.documents)
-        return new_count - old_count
+    def scan_for_new_documents(self) -> int:
+        """Scan the folder for added, modified and deleted documents; returns the number of changes"""
+        changes = self.load_existing_documents()
+        return sum(len(doc_names) for doc_names in changes.values())
     
-    def search_knowledge_base(self, question: str, k: int = 3) -> List[Dict]:
-        """Search the knowledge base for relevant information"""
+    def _ensure_bm25_index(self):
+        """Index documents that were added before the BM25 index existed"""
+        if self._bm25_checked:
+            return
+        self._bm25_checked = True
+        missing = set(self.documents) - self.bm25_index.indexed_documents()
+        for doc_name in missing:
+            chunks = self.chunk_store.get_store_chunks(f"vs_{doc_name}")
+            if chunks:
+                self.bm25_index.index_document(doc_name, chunks)
+        if missing:
+            logger.info(f"Built BM25 postings for {len(missing)} existing documents")
+    
+    def _prepare_search(self, mode: str):
+        """Finish deferred loading under the write lock, so searches only need the read lock"""
+        load_vectors = mode != "lexical" and not self._combined_synced and self.documents
+        backfill_bm25 = mode != "vector" and not self._bm25_checked
+        if load_vectors or backfill_bm25:
+            with self.rw_lock.write():
+                if load_vectors:
+                    self.ensure_combined_vectordb()
+                if backfill_bm25:
+                    self._ensure_bm25_index()
+    
+    def _vector_search(self, question: str, k: int) -> List[Document]:
+        """Dense similarity search over the combined store"""
         if not self.combined_vectordb:
             return []
-        
+        return self.combined_vectordb.similarity_search(question, k=k)
+    
+    def _vector_search_batch(self, questions: List[str], k: int) -> List[List[Document]]:
+        """Dense search for several questions with one FAISS call"""
+        vectordb = self.combined_vectordb
+        if not vectordb or not questions:
+            return [[] for _ in questions]
+        vectors = np.asarray(self.embeddings.embed_queries(questions), dtype=np.float32)
+        _, positions = vectordb.index.search(vectors, k)
+        batch = []
+        for row in positions:
+            docs = []
+            for position in row:
+                if position == -1:
+                    continue
+                doc = vectordb.docstore.search(vectordb.index_to_docstore_id[position])
+                if isinstance(doc, Document):
+                    docs.append(doc)
+            batch.append(docs)
+        return batch
+    
+    def _lexical_search(self, question: str, k: int) -> List[Document]:
+        """BM25 search; needs no query embedding"""
+        docs = []
+        for chunk_id, _ in self.bm25_index.search(question, k):
+            doc = self.chunk_store.search(chunk_id)
+            if isinstance(doc, Document):
+                docs.append(doc)
+        return docs
+    
+    def _hybrid_search(self, question: str, k: int) -> List[Document]:
+        """Fuse vector and BM25 rankings with reciprocal-rank fusion"""
+        candidates = max(k, HYBRID_CANDIDATES)
+        return self._fuse_rankings(
+            [self._vector_search(question, candidates), self._lexical_search(question, candidates)], k
+        )
+    
+    @staticmethod
+    def _fuse_rankings(rankings: List[List[Document]], k: int) -> List[Document]:
+        """Reciprocal-rank fusion of several ranked lists"""
+        fused = Counter()
+        docs = {}
+        for ranked in rankings:
+            for rank, doc in enumerate(ranked, start=1):
+                fused[doc.id] += 1.0 / (RRF_K + rank)
+                docs[doc.id] = doc
+        return [docs[chunk_id] for chunk_id, _ in fused.most_common(k)]
+    
+    @staticmethod
+    def _format_results(docs: List[Document]) -> List[Dict]:
+        return [{'content': doc.page_content, 'metadata': doc.metadata} for doc in docs]
+    
+    def search_knowledge_base(self, question: str, k: int = 3, mode: Optional[str] = None) -> List[Dict]:
+        """Search the knowledge base for relevant information"""
+        mode = mode or RETRIEVAL_MODE
         try:
-            docs = self.combined_vectordb.similarity_search(question, k=k)
-            results = []
-            for doc in docs:
-                results.append({
-                    'content': doc.page_content,
-                    'metadata': doc.metadata
-                })
-            return results
+            self._prepare_search(mode)
+            with self.rw_lock.read():
+                if mode == "lexical":
+                    docs = self._lexical_search(question, k)
+                elif mode == "hybrid":
+                    docs = self._hybrid_search(question, k)
+                else:
+                    docs = self._vector_search(question, k)
+            return self._format_results(docs)
         except Exception as e:
             logger.error(f"Error searching knowledge base: {e}")
             return []
+    
+    def search_batch(self, questions: List[str], k: int = 3, mode: Optional[str] = None) -> List[List[Dict]]:
+        """Search for several questions at once: one embedding round and one FAISS call for the batch"""
+        mode = mode or RETRIEVAL_MODE
+        try:
+            self._prepare_search(mode)
+            candidates = k if mode == "vector" else max(k, HYBRID_CANDIDATES)
+            with self.rw_lock.read():
+                if mode == "lexical":
+                    vector_hits = [[] for _ in questions]
+                else:
+                    vector_hits = self._vector_search_batch(questions, candidates)
+                batch = []
+                for question, vector_docs in zip(questions, vector_hits):
+                    if mode == "lexical":
+                        docs = self._lexical_search(question, k)
+                    elif mode == "hybrid":
+                        docs = self._fuse_rankings([vector_docs, self._lexical_search(question, candidates)], k)
+                    else:
+                        docs = vector_docs
+                    batch.append(self._format_results(docs))
+            return batch
+        except Exception as e:
+            logger.error(f"Error searching knowledge base: {e}")
+            return [[] for _ in questions]
+
+class StreamingAnswer:
+    """Iterator over answer text chunks returned by RAGSystem.ask_question_stream
+    (and AsyncRAGPipeline.stream/astream, which are iterated with `async for`)"""
+    
+    def __init__(self):
+        self._chunks = iter(())
+        self._async_chunks = None
+        self.result = None  # ask_question-style dict, set once iteration finishes
+    
+    def __iter__(self):
+        return self._chunks
+    
+    def __aiter__(self):
+        if self._async_chunks is None:
+            raise TypeError("This answer stream is synchronous; iterate it with a plain for loop")
+        return self._async_chunks
+
 
 class RAGSystem:
     """Standalone RAG System - No Web Interface"""
     
     def __init__(self):
         """Initialize the RAG system"""
+        self._init_started = time.time()
         self.kb_manager = KnowledgeBaseManager()
         self.llm = Ollama(model=ANSWER_MODEL)
-        print(f"🤖 RAG System initialized with {len(self.kb_manager.documents)} documents")
+        self.startup_time = time.time() - self._init_started
+        self.time_to_first_query = None
+        self._async_pipeline = None
+        self._async_pipeline_lock = threading.Lock()
+        self.last_batch_stats = {}
+        print(f"🤖 RAG System initialized with {len(self.kb_manager.documents)} documents in {self.startup_time:.2f}s")
+    
+    def ask_question(self, question: str, use_cache: bool = True, k: int = 3,
+                     mode: Optional[str] = None) -> Dict:
+        """Ask a question to the knowledge base (mode: "vector", "hybrid" or "lexical")"""
+        result = self._answer_question(question, use_cache=use_cache, k=k, mode=mode)
+        if self.time_to_first_query is None:
+            self._record_first_query()
+        return result
+    
+    def _record_first_query(self):
+        """Measure time from construction until the first answered query"""
+        self.time_to_first_query = time.time() - self._init_started
+        self.kb_manager.log_operation(
+            "time_to_first_query",
+            f"Startup {self.startup_time:.2f}s, first query done at {self.time_to_first_query:.2f}s",
+            self.time_to_first_query
+        )
+        print(f"⏱️  Time to first query: {self.time_to_first_query:.2f}s (startup {self.startup_time:.2f}s)")
+    
+    def ask_question_stream(self, question: str, use_cache: bool = True, k: int = 3,
+                            mode: Optional[str] = None) -> "StreamingAnswer":
+        """Ask a question and receive the answer as it is generated
+        
+        Iterate the returned StreamingAnswer for text chunks; afterwards its `result` holds the
+        same dict as ask_question plus time_to_first_token. Cached answers arrive as one chunk.
+        """
+        stream = StreamingAnswer()
+        stream._chunks = self._stream_answer(stream, question, use_cache, k, mode)
+        return stream
+    
+    def _stream_answer(self, stream: "StreamingAnswer", question: str, use_cache: bool, k: int,
+                       mode: Optional[str]):
+        """Generator behind ask_question_stream"""
+        start_time = time.time()
+        prepared = self._prepare_answer(question, use_cache, k, mode, start_time)
+        if 'result' in prepared:
+            stream.result = prepared['result']
+            stream.result['time_to_first_token'] = stream.result.get('execution_time')
+            if 'answer' in stream.result:
+                yield stream.result['answer']
+        else:
+            chunks = []
+            time_to_first_token = None
+            try:
+                print(f"🔍 Generating answer for: {question}")
+                for chunk in self.llm.stream(prepared['prompt']):
+                    if time_to_first_token is None:
+                        time_to_first_token = time.time() - start_time
+                    chunks.append(chunk)
+                    yield chunk
+            except Exception as e:
+                logger.error(f"Error generating answer: {e}")
+                stream.result = {"error": f"Error generating answer: {str(e)}"}
+                return
+            # The caller is still printing the answer and reports timings itself
+            stream.result = self._finish_answer(question, "".join(chunks), prepared, use_cache, start_time,
+                                                time_to_first_token, announce=False)
+        if self.time_to_first_query is None:
+            self._record_first_query()
     
-    def ask_question(self, question: str, use_cache: bool = True, k: int = 3) -> Dict:
-        """Ask a question to the knowledge base"""
+    def _answer_question(self, question: str, use_cache: bool, k: int, mode: Optional[str] = None) -> Dict:
+        """Cache lookup, retrieval and generation for one question"""
         start_time = time.time()
+        prepared = self._prepare_answer(question, use_cache, k, mode, start_time)
+        if 'result' in prepared:
+            return prepared['result']
+        
+        try:
+            print(f"🔍 Generating answer for: {question}")
+            answer = self.llm.invoke(prepared['prompt'])
+            return self._finish_answer(question, answer, prepared, use_cache, start_time)
+        except Exception as e:
+            logger.error(f"Error generating answer: {e}")
+            return {"error": f"Error generating answer: {str(e)}"}
+    
+    def _prepare_answer(self, question: str, use_cache: bool, k: int, mode: Optional[str],
+                        start_time: float) -> Dict:
+        """Cache lookup and retrieval: returns {'result': ...} when no generation is needed,
+        otherwise the prompt and what is needed to cache the generated answer"""
+        # Aggregate/lookup questions about a single table are answered exactly from the table store
+        structured = self.kb_manager.answer_from_tables(question)
+        if structured:
+            execution_time = time.time() - start_time
+            self.kb_manager.log_operation(
+                "structured_answer", f"Question: {question[:50]}... (table {structured['table']})", execution_time
+            )
+            print(f"📊 Answered from table '{structured['table']}' in {execution_time:.3f}s")
+            return {'result': dict(structured, cached=False, structured=True, execution_time=execution_time)}
         
-        # Check cache first
+        # Check cache first; the question vector is reused by vector search via the query-embedding cache.
+        # Lexical retrieval never embeds the question, so it only checks the exact-match tier
+        question_vector = None
         if use_cache:
-            cached = self.kb_manager.get_cached_answer(question)
+            if SEMANTIC_CACHE_ENABLED and (mode or RETRIEVAL_MODE) != "lexical":
+                try:
+                    question_vector = self.kb_manager.embeddings.embed_query(question)
+                except Exception as e:
+                    logger.error(f"Error embedding question for semantic cache: {e}")
+            cached = self.kb_manager.get_cached_answer(question, question_vector)
             if cached:
                 execution_time = time.time() - start_time
-                self.kb_manager.log_operation("cached_answer", f"Question: {question[:50]}...", execution_time)
-                print(f"💾 Retrieved cached answer in {execution_time:.2f}s")
-                return {
+                self.kb_manager.log_operation(
+                    "cached_answer",
+                    f"Question: {question[:50]}... ({cached['match']} match, similarity {cached['similarity']:.3f})",
+                    execution_time
+                )
+                print(f"💾 Retrieved cached answer ({cached['match']} match) in {execution_time:.2f}s")
+                return {'result': {
                     "answer": cached['answer'],
                     "cached": True,
+                    "cache_match": cached['match'],
+                    "similarity": cached['similarity'],
+                    "cached_question": cached['question'],
                     "timestamp": cached['timestamp'],
                     "execution_time": execution_time,
                     "source_files": cached['source_files']
-                }
+                }}
         
         # Search knowledge base
-        search_results = self.kb_manager.search_knowledge_base(question, k=k)
+        search_results = self.kb_manager.search_knowledge_base(question, k=k, mode=mode)
         
         if not search_results:
-            return {
+            return {'result': {
                 "answer": "No relevant information found in knowledge base",
                 "cached": False,
                 "execution_time": time.time() - start_time
-            }
+            }}
         
+        prepared = self._build_prompt(question, search_results)
+        prepared['question_vector'] = question_vector
+        return prepared
+    
+    def _build_prompt(self, question: str, search_results: List[Dict]) -> Dict:
+        """Prompt, context and source files for generating an answer from search results"""
         # Combine context from search results
         context = "\n\n".join([result['content'] for result in search_results])
         source_files = list(set([result['metadata'].get('source', 'unknown') for result in search_results]))
@@ -491,59 +3423,217 @@ QUESTION: {question}
 
 ANSWER (Be specific and include exact values from tables/columns if found):
 """
+        return {
+            'prompt': prompt,
+            'context': context,
+            'source_files': source_files
+        }
+    
+    def _finish_answer(self, question: str, answer: str, prepared: Dict, use_cache: bool, start_time: float,
+                       time_to_first_token: Optional[float] = None, announce: bool = True) -> Dict:
+        """Cache and log a generated answer and build the result dict"""
+        execution_time = time.time() - start_time
+        if use_cache:
+            self.kb_manager.cache_answer(question, answer, prepared['context'], prepared['source_files'],
+                                         question_vector=prepared['question_vector'],
+                                         generation_time=execution_time)
         
-        try:
-            print(f"🔍 Generating answer for: {question}")
-            answer = self.llm.invoke(prompt)
-            
-            # Cache the answer
-            if use_cache:
-                self.kb_manager.cache_answer(question, answer, context, source_files)
-            
-            execution_time = time.time() - start_time
-            self.kb_manager.log_operation("answer_generated", f"Question: {question[:50]}...", execution_time)
+        details = f"Question: {question[:50]}..."
+        if time_to_first_token is not None:
+            details += f" (first token after {time_to_first_token:.2f}s)"
+        self.kb_manager.log_operation("answer_generated", details, execution_time)
+        if announce:
             print(f"✅ Answer generated in {execution_time:.2f}s")
-            
-            return {
-                "answer": answer,
-                "cached": False,
-                "source_files": source_files,
-                "execution_time": execution_time
-            }
-            
-        except Exception as e:
-            logger.error(f"Error generating answer: {e}")
-            return {"error": f"Error generating answer: {str(e)}"}
+        
+        result = {
+            "answer": answer,
+            "cached": False,
+            "source_files": prepared['source_files'],
+            "execution_time": execution_time
+        }
+        if time_to_first_token is not None:
+            result["time_to_first_token"] = time_to_first_token
+        return result
+    
+    def ask_batch(self, questions: List[str], use_cache: bool = True, k: int = 3, mode: Optional[str] = None,
+                  max_workers: int = LLM_MAX_CONCURRENCY) -> List[Dict]:
+        """Answer many questions: one embedding round and one FAISS search for all cache misses,
+        then generation with at most max_workers concurrent LLM calls
+        
+        Results come back in input order, each with its own cache-lookup and generation time and
+        the batch-wide embedding and search times; totals per stage are kept in last_batch_stats.
+        """
+        batch_start = time.time()
+        mode = mode or RETRIEVAL_MODE
+        stage_times = {'embedding': 0.0, 'cache_lookup': 0.0, 'search': 0.0, 'generation': 0.0}
+        
+        # Identical questions (same cache key) are answered once
+        unique = {}
+        for question in questions:
+            unique.setdefault(self.kb_manager.get_question_hash(question), question)
+        unique_questions = list(unique.values())
+        answers = {}
+        timings = {question: {'cache_lookup': 0.0, 'generation': 0.0} for question in unique_questions}
+        
+        # Table questions are answered from the table store and skip embedding, search and the LLM
+        remaining = []
+        for question in unique_questions:
+            lookup_start = time.time()
+            structured = self.kb_manager.answer_from_tables(question)
+            timings[question]['cache_lookup'] = time.time() - lookup_start
+            if structured:
+                answers[question] = dict(structured, cached=False, structured=True)
+            else:
+                remaining.append(question)
+        
+        # Embed every question in one batched call (reused by the semantic cache and vector search);
+        # lexical mode embeds nothing and checks only the exact-match cache tier
+        vectors = {}
+        if remaining and mode != "lexical":
+            stage_start = time.time()
+            vectors = dict(zip(remaining, self.kb_manager.embeddings.embed_queries(remaining)))
+            stage_times['embedding'] = time.time() - stage_start
+        
+        pending = remaining
+        if use_cache:
+            pending = []
+            stage_start = time.time()
+            for question in remaining:
+                lookup_start = time.time()
+                cached = self.kb_manager.get_cached_answer(
+                    question, vectors.get(question) if SEMANTIC_CACHE_ENABLED else None
+                )
+                timings[question]['cache_lookup'] += time.time() - lookup_start
+                if cached:
+                    answers[question] = {
+                        "answer": cached['answer'],
+                        "cached": True,
+                        "cache_match": cached['match'],
+                        "similarity": cached['similarity'],
+                        "cached_question": cached['question'],
+                        "timestamp": cached['timestamp'],
+                        "source_files": cached['source_files']
+                    }
+                else:
+                    pending.append(question)
+            stage_times['cache_lookup'] = time.time() - stage_start
+        
+        # One vectorized search for every question that still needs an answer
+        stage_start = time.time()
+        search_results = self.kb_manager.search_batch(pending, k=k, mode=mode) if pending else []
+        stage_times['search'] = time.time() - stage_start
+        
+        to_generate = []
+        for question, results in zip(pending, search_results):
+            if results:
+                prepared = self._build_prompt(question, results)
+                prepared['question_vector'] = vectors.get(question)
+                to_generate.append((question, prepared))
+            else:
+                answers[question] = {"answer": "No relevant information found in knowledge base", "cached": False}
+        
+        def generate(question: str, prepared: Dict) -> Dict:
+            start_time = time.time()
+            try:
+                answer = self.llm.invoke(prepared['prompt'])
+            except Exception as e:
+                logger.error(f"Error generating answer: {e}")
+                return {"error": f"Error generating answer: {str(e)}"}
+            finally:
+                timings[question]['generation'] = time.time() - start_time
+            return self._finish_answer(question, answer, prepared, use_cache, start_time, announce=False)
+        
+        stage_start = time.time()
+        if to_generate:
+            print(f"🔍 Generating {len(to_generate)} answers ({max(1, max_workers)} at a time)")
+            with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+                futures = {executor.submit(generate, question, prepared): question for question, prepared in to_generate}
+                for future in as_completed(futures):
+                    answers[futures[future]] = future.result()
+        stage_times['generation'] = time.time() - stage_start
+        
+        results = []
+        for question in questions:
+            canonical = unique[self.kb_manager.get_question_hash(question)]
+            # Embedding and search ran once for the whole batch, so their totals are reported as such
+            result = dict(answers[canonical], question=question, timings=dict(
+                timings[canonical], batch_embedding=stage_times['embedding'], batch_search=stage_times['search']
+            ))
+            result['execution_time'] = result['timings']['cache_lookup'] + result['timings']['generation']
+            results.append(result)
+        
+        execution_time = time.time() - batch_start
+        self.last_batch_stats = {
+            "questions": len(questions),
+            "unique_questions": len(unique_questions),
+            "structured": len(unique_questions) - len(remaining),
+            "cached": len(remaining) - len(pending),
+            "generated": len(to_generate),
+            "stage_times": stage_times,
+            "execution_time": execution_time,
+            "questions_per_sec": len(questions) / execution_time if execution_time else 0.0
+        }
+        self.kb_manager.log_operation(
+            "ask_batch",
+            f"{len(questions)} questions ({len(unique_questions)} unique, {len(to_generate)} generated)",
+            execution_time
+        )
+        if self.time_to_first_query is None and questions:
+            self._record_first_query()
+        return results
     
     def add_document(self, file_path: str) -> bool:
         """Add a document to the knowledge base"""
-        file_ext = os.path.splitext(file_path)[1].lower()
-        doc_type = {'.pdf': 'pdf', '.txt': 'txt', '.csv': 'csv'}.get(file_ext, 'txt')
-        return self.kb_manager.add_document(file_path, doc_type)
+        return self.kb_manager.add_document(file_path, get_doc_type(file_path))
     
     def scan_for_new_documents(self) -> int:
-        """Scan for new documents in the knowledge base folder"""
+        """Scan for new, modified and deleted documents in the knowledge base folder"""
         return self.kb_manager.scan_for_new_documents()
     
+    def rebuild_index(self):
+        """Fully rebuild the combined vector database"""
+        self.kb_manager.rebuild_combined_vectordb()
+    
+    def rebuild_tables(self) -> int:
+        """Re-extract the table store from every PDF, Excel and CSV document"""
+        return self.kb_manager.rebuild_table_store()
+    
+    def compact_index(self):
+        """Fold appended documents into a freshly written combined vector database"""
+        self.kb_manager.ensure_combined_vectordb()
+        self.kb_manager.compact_combined_vectordb()
+    
     def get_status(self) -> Dict:
         """Get system status"""
         cache_size = self._get_cache_size()
+        with self.kb_manager.rw_lock.read():
+            documents = list(self.kb_manager.documents.keys())
         return {
-            "total_documents": len(self.kb_manager.documents),
-            "documents": list(self.kb_manager.documents.keys()),
+            "total_documents": len(documents),
+            "documents": documents,
             "cache_size": cache_size,
-            "knowledge_base_dir": KNOWLEDGE_BASE_DIR
+            "knowledge_base_dir": KNOWLEDGE_BASE_DIR,
+            "startup_time": self.startup_time,
+            "time_to_first_query": self.time_to_first_query,
+            "query_embedding_cache": self.kb_manager.embeddings.get_query_cache_stats(),
+            "answer_cache": self.kb_manager.get_answer_cache_stats(),
+            "table_store": self.kb_manager.table_store.get_stats(),
+            "debug_log": self.kb_manager.log_writer.get_stats(),
+            "sqlite_pool": dict(DB_POOL.stats),
+            "async_pipeline": self._async_pipeline.get_stats() if self._async_pipeline else None
         }
     
     def _get_cache_size(self) -> int:
         """Get number of cached answers"""
-        conn = sqlite3.connect(CACHE_DB)
-        cursor = conn.cursor()
-        try:
-            cursor.execute("SELECT COUNT(*) FROM cached_answers")
-            return cursor.fetchone()[0]
-        finally:
-            conn.close()
+        return self.kb_manager.get_cache_size()
+    
+    @property
+    def async_pipeline(self) -> "AsyncRAGPipeline":
+        """Shared asyncio pipeline that coalesces identical concurrent questions (started on first use)"""
+        with self._async_pipeline_lock:
+            if self._async_pipeline is None:
+                self._async_pipeline = AsyncRAGPipeline(self)
+            return self._async_pipeline
     
     def list_documents(self):
         """List all documents in the knowledge base"""
@@ -573,6 +3663,203 @@ ANSWER (Be specific and include exact values from tables/columns if found):
         }
 
 
+class _InFlightAnswer:
+    """One generation shared by every identical question asked while it runs"""
+    
+    def __init__(self):
+        self.chunks = []
+        self.result = None
+        self.done = False
+        self.followers = 0
+        self._updated = asyncio.Event()
+    
+    def push(self, chunk: str):
+        self.chunks.append(chunk)
+        self._notify()
+    
+    def finish(self, result: Dict):
+        self.result = result
+        self.done = True
+        self._notify()
+    
+    def _notify(self):
+        updated, self._updated = self._updated, asyncio.Event()
+        updated.set()
+    
+    async def follow(self):
+        """Yield every chunk from the start, then new ones as they arrive"""
+        position = 0
+        while True:
+            while position < len(self.chunks):
+                position += 1
+                yield self.chunks[position - 1]
+            if self.done:
+                return
+            await self._updated.wait()
+
+
+class AsyncRAGPipeline:
+    """asyncio pipeline (cache lookup -> retrieval -> generation) over a RAGSystem
+    
+    The pipeline owns an event loop on a daemon thread, so it can be used from plain
+    threads (ask_sync, stream) as well as from any other event loop (ask, astream).
+    Identical questions in flight at the same time share one lookup and generation
+    (single-flight); followers receive the chunks produced so far and then the rest.
+    At most LLM_MAX_CONCURRENCY generations reach Ollama at once, the others queue.
+    Blocking stages (SQLite, embeddings, FAISS, the Ollama client) run in worker threads.
+    """
+    
+    _END = object()
+    
+    def __init__(self, rag_system: "RAGSystem", max_concurrency: int = LLM_MAX_CONCURRENCY):
+        self.rag = rag_system
+        self.max_concurrency = max(1, max_concurrency)
+        self.stats = {'requests': 0, 'coalesced': 0, 'generations': 0, 'active_generations': 0, 'queued': 0}
+        self._in_flight = {}
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="rag-async-pipeline", daemon=True)
+        self._thread.start()
+        self._semaphore = asyncio.run_coroutine_threadsafe(self._create_semaphore(), self.loop).result()
+    
+    async def _create_semaphore(self) -> asyncio.Semaphore:
+        return asyncio.Semaphore(self.max_concurrency)
+    
+    def _join(self, question: str, use_cache: bool, k: int, mode: Optional[str]) -> tuple:
+        """Attach to the in-flight answer for this question or start one (runs on the pipeline loop)"""
+        key = (self.rag.kb_manager.get_question_hash(question), use_cache, k, mode or RETRIEVAL_MODE)
+        self.stats['requests'] += 1
+        flight = self._in_flight.get(key)
+        if flight is not None:
+            flight.followers += 1
+            self.stats['coalesced'] += 1
+            return flight, True
+        flight = self._in_flight[key] = _InFlightAnswer()
+        self.loop.create_task(self._run(key, flight, question, use_cache, k, mode))
+        return flight, False
+    
+    async def _run(self, key: tuple, flight: _InFlightAnswer, question: str, use_cache: bool, k: int,
+                   mode: Optional[str]):
+        """Leader: produce the answer for every request attached to this flight"""
+        start_time = time.time()
+        try:
+            prepared = await asyncio.to_thread(self.rag._prepare_answer, question, use_cache, k, mode, start_time)
+            if 'result' in prepared:
+                result = prepared['result']
+                result['time_to_first_token'] = result.get('execution_time')
+                if 'answer' in result:
+                    flight.push(result['answer'])
+            else:
+                self.stats['queued'] += 1
+                async with self._semaphore:
+                    self.stats['queued'] -= 1
+                    self.stats['active_generations'] += 1
+                    self.stats['generations'] += 1
+                    try:
+                        print(f"🔍 Generating answer for: {question}")
+                        answer, time_to_first_token = await asyncio.to_thread(
+                            self._generate, flight, prepared['prompt'], start_time
+                        )
+                    finally:
+                        self.stats['active_generations'] -= 1
+                result = await asyncio.to_thread(
+                    self.rag._finish_answer, question, answer, prepared, use_cache, start_time, time_to_first_token,
+                    False
+                )
+            if self.rag.time_to_first_query is None:
+                self.rag._record_first_query()
+        except Exception as e:
+            logger.error(f"Error generating answer: {e}")
+            result = {"error": f"Error generating answer: {str(e)}"}
+        finally:
+            self._in_flight.pop(key, None)
+        if flight.followers:
+            self.rag.kb_manager.log_operation(
+                "coalesced_answer", f"Question: {question[:50]}... shared by {flight.followers + 1} requests",
+                time.time() - start_time
+            )
+        flight.finish(result)
+    
+    def _generate(self, flight: _InFlightAnswer, prompt: str, start_time: float) -> tuple:
+        """Stream the LLM in a worker thread, handing chunks to the loop as they arrive"""
+        chunks = []
+        time_to_first_token = None
+        for chunk in self.rag.llm.stream(prompt):
+            if time_to_first_token is None:
+                time_to_first_token = time.time() - start_time
+            chunks.append(chunk)
+            self.loop.call_soon_threadsafe(flight.push, chunk)
+        return "".join(chunks), time_to_first_token
+    
+    async def _relay(self, question: str, use_cache: bool, k: int, mode: Optional[str], put) -> Dict:
+        """Forward a flight's chunks through put() and return the final result (runs on the pipeline loop)"""
+        try:
+            flight, coalesced = self._join(question, use_cache, k, mode)
+            async for chunk in flight.follow():
+                put(chunk)
+            return dict(flight.result, coalesced=coalesced)
+        finally:
+            put(self._END)
+    
+    def _submit(self, question: str, use_cache: bool, k: int, mode: Optional[str], put):
+        return asyncio.run_coroutine_threadsafe(self._relay(question, use_cache, k, mode, put), self.loop)
+    
+    async def ask(self, question: str, use_cache: bool = True, k: int = 3, mode: Optional[str] = None) -> Dict:
+        """Answer a question from any event loop; identical concurrent questions share one generation"""
+        return await asyncio.wrap_future(self._submit(question, use_cache, k, mode, lambda chunk: None))
+    
+    def ask_sync(self, question: str, use_cache: bool = True, k: int = 3, mode: Optional[str] = None) -> Dict:
+        """Blocking ask() for threads without an event loop"""
+        return self._submit(question, use_cache, k, mode, lambda chunk: None).result()
+    
+    def stream(self, question: str, use_cache: bool = True, k: int = 3,
+               mode: Optional[str] = None) -> StreamingAnswer:
+        """Like RAGSystem.ask_question_stream, but coalesced and rate-limited; iterate with a plain for loop"""
+        answer = StreamingAnswer()
+        chunks = queue.Queue()
+        
+        def iterate():
+            future = self._submit(question, use_cache, k, mode, chunks.put)
+            while True:
+                chunk = chunks.get()
+                if chunk is self._END:
+                    break
+                yield chunk
+            answer.result = future.result()
+        
+        answer._chunks = iterate()
+        return answer
+    
+    def astream(self, question: str, use_cache: bool = True, k: int = 3,
+                mode: Optional[str] = None) -> StreamingAnswer:
+        """Streaming answer for `async for` from any event loop"""
+        answer = StreamingAnswer()
+        
+        async def iterate():
+            caller_loop = asyncio.get_running_loop()
+            chunks = asyncio.Queue()
+            future = asyncio.wrap_future(self._submit(
+                question, use_cache, k, mode, lambda chunk: caller_loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+            ))
+            while True:
+                chunk = await chunks.get()
+                if chunk is self._END:
+                    break
+                yield chunk
+            answer.result = await future
+        
+        answer._async_chunks = iterate()
+        return answer
+    
+    def get_stats(self) -> Dict[str, int]:
+        """Request, coalescing and generation counters"""
+        return dict(self.stats, in_flight=len(self._in_flight), max_concurrency=self.max_concurrency)
+    
+    def close(self):
+        """Stop the pipeline's event loop"""
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+
+
 def demo_usage():
     """Demonstrate how to use the RAG system"""
     print("=" * 60)
@@ -630,6 +3917,145 @@ def demo_usage():
     return rag
 
 
+def benchmark_embedding_pipeline(num_chunks: int = 2000, batch_size: int = EMBED_BATCH_SIZE,
+                                 max_workers: int = EMBED_MAX_WORKERS, latency: float = 0.05):
+    """Measure embedding throughput offline using the stub embedder"""
+    embeddings = StubEmbeddings(latency=latency)
+    texts = [f"Benchmark chunk {i}: " + "lorem ipsum dolor sit amet " * 30 for i in range(num_chunks)]
+    
+    print("=" * 60)
+    print(f"⚡ Embedding pipeline benchmark ({num_chunks} chunks, {latency * 1000:.0f}ms per request)")
+    print("=" * 60)
+    
+    for label, size, workers in [("Unbatched, serial", 1, 1),
+                                 ("Batched, serial", batch_size, 1),
+                                 ("Batched, concurrent", batch_size, max_workers)]:
+        pipeline = EmbeddingPipeline(embeddings, batch_size=size, max_workers=workers)
+        sample = texts if size > 1 else texts[:max(1, num_chunks // 10)]
+        pipeline.embed(sample)
+        stats = pipeline.last_stats
+        print(f"{label:22} | batch={size:<4} workers={workers:<3} | "
+              f"{stats['chunks']:>6} chunks | {stats['seconds']:7.2f}s | {stats['chunks_per_sec']:9.1f} chunks/sec")
+
+
+def benchmark_index_backends(num_vectors: int = 50000, dimensions: int = 256, num_queries: int = 200, k: int = 10):
+    """Compare recall@k and latency of the IVF backends against exact flat search on synthetic data"""
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((256, dimensions)).astype(np.float32)
+    vectors = (centers[rng.integers(0, 256, num_vectors)]
+               + 0.3 * rng.standard_normal((num_vectors, dimensions))).astype(np.float32)
+    queries = vectors[rng.choice(num_vectors, num_queries, replace=False)] + 0.05
+    
+    flat = build_backend_index(vectors, "flat")
+    start_time = time.time()
+    _, truth = flat.search(queries, k)
+    flat_ms = (time.time() - start_time) * 1000 / num_queries
+    
+    print("=" * 60)
+    print(f"📐 Index backend benchmark ({num_vectors} x {dimensions}, recall@{k})")
+    print("=" * 60)
+    print(f"{'flat':10} | nprobe=-    | recall 1.000 | {flat_ms:7.3f} ms/query")
+    
+    for backend in ("ivf_flat", "ivf_pq"):
+        index = build_backend_index(vectors, backend)
+        for nprobe in (1, 4, 16, 64):
+            configure_index(index, nprobe)
+            start_time = time.time()
+            _, found = index.search(queries, k)
+            elapsed_ms = (time.time() - start_time) * 1000 / num_queries
+            recall = np.mean([len(set(found[i]) & set(truth[i])) / k for i in range(num_queries)])
+            print(f"{backend:10} | nprobe={nprobe:<4} | recall {recall:.3f} | {elapsed_ms:7.3f} ms/query")
+
+
+def benchmark_splitters(file_paths: Optional[List[str]] = None, num_probes: int = 200, k: int = 3):
+    """Compare the character splitter with the table-aware token splitter on index size and retrieval
+    
+    Probes are whole table rows and prose sentences sampled from the loaded documents. A probe counts
+    as found when one of the k nearest chunks contains it verbatim (self-retrieval recall@k), and as
+    split when no chunk contains it at all.
+    """
+    file_paths = file_paths or sorted(
+        path for path in glob.glob(os.path.join(KNOWLEDGE_BASE_DIR, "*"))
+        if os.path.splitext(path)[1].lower() in SUPPORTED_DOC_TYPES
+    )
+    docs = [(doc, get_doc_type(path)) for path in file_paths for doc in get_loader(path, get_doc_type(path)).lazy_load()]
+    if not docs:
+        print(f"📁 No documents to benchmark in {KNOWLEDGE_BASE_DIR}/")
+        return
+    
+    candidates = []
+    for doc, _ in docs:
+        if doc.metadata.get('type') in TABLE_CHUNK_TYPES:
+            candidates.extend(block.strip("\n") for block in re.split(r"\n\s*\n", doc.page_content)
+                              if TableAwareTextSplitter.ROW_BLOCK.match(block.strip()))
+        else:
+            candidates.extend(sentence.strip() for sentence in TableAwareTextSplitter.SENTENCE_END.split(doc.page_content)[0::2]
+                              if len(sentence.split()) >= 8 and "\n\n" not in sentence.strip())
+    rng = np.random.default_rng(0)
+    probes = [candidates[i] for i in rng.choice(len(candidates), min(num_probes, len(candidates)), replace=False)]
+    
+    embeddings = CachedEmbeddings(OllamaEmbeddings(model=EMBED_MODEL), EMBED_MODEL_ID)
+    pipeline = EmbeddingPipeline(embeddings)
+    query_vectors = np.array(embeddings.embed_queries(probes), dtype=np.float32) if probes else None
+    
+    print("=" * 60)
+    print(f"✂️  Splitter benchmark ({len(file_paths)} files, {len(probes)} probes, recall@{k}, "
+          f"tokens from {EMBED_TOKENIZER_FILE or 'estimate'})")
+    print("=" * 60)
+    
+    splitters = [
+        ("recursive", lambda doc_type: RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)),
+        ("table_aware", TableAwareTextSplitter)
+    ]
+    for label, make_splitter in splitters:
+        start_time = time.time()
+        texts = [chunk.page_content for doc, doc_type in docs for chunk in make_splitter(doc_type).split_documents([doc])]
+        split_time = time.time() - start_time
+        vectors = np.array(pipeline.embed(texts), dtype=np.float32)
+        index = faiss.IndexFlatL2(vectors.shape[1])
+        index.add(vectors)
+        
+        tokens = [count_tokens(text) for text in texts]
+        split = found = 0
+        if probes:
+            _, neighbours = index.search(query_vectors, min(k, len(texts)))
+            for probe, ids in zip(probes, neighbours):
+                found += any(probe in texts[i] for i in ids if i >= 0)
+                split += not any(probe in text for text in texts)
+        print(f"{label:12} | {len(texts):>6} chunks | {vectors.nbytes / 1024 / 1024:7.2f} MB | "
+              f"tokens avg {np.mean(tokens):6.1f} max {max(tokens):5} | split {split:>4} | "
+              f"recall {found / max(1, len(probes)):.3f} | {split_time:6.2f}s")
+
+
+def run_batch_file(rag_system, input_path: str, output_path: Optional[str] = None) -> str:
+    """Answer every question in a JSONL file and write one JSON result per line
+    
+    Input lines are either {"question": ..., "id": ...} objects (id optional) or plain JSON strings.
+    """
+    records = []
+    with open(input_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                records.append(record if isinstance(record, dict) else {"question": record})
+    output_path = output_path or f"{os.path.splitext(input_path)[0]}.results.jsonl"
+    
+    print(f"📋 Answering {len(records)} questions from {input_path}")
+    results = rag_system.ask_batch([record['question'] for record in records])
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for record, result in zip(records, results):
+            if 'id' in record:
+                result = dict(result, id=record['id'])
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    
+    stats = rag_system.last_batch_stats
+    print(f"✅ Wrote {len(results)} results to {output_path}")
+    print(f"   {stats['unique_questions']} unique, {stats['cached']} from cache, {stats['generated']} generated "
+          f"in {stats['execution_time']:.2f}s ({stats['questions_per_sec']:.1f} questions/sec)")
+    print("   Stages: " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in stats['stage_times'].items()))
+    return output_path
+
+
 def interactive_mode(rag_system):
     """Interactive question-answer mode"""
     print("\n" + "=" * 60)
@@ -646,27 +4072,47 @@ def interactive_mode(rag_system):
                 break
             elif question.lower() == 'status':
                 status = rag_system.get_status()
-                print(f"📊 Documents: {status['total_documents']}, Cache: {status['cache_size']}")
+                query_cache = status['query_embedding_cache']
+                print(f"📊 Documents: {status['total_documents']}, Cache: {status['cache_size']}, "
+                      f"Query vectors: {query_cache['memory_hits'] + query_cache['disk_hits']} hits / "
+                      f"{query_cache['misses']} misses")
+                answer_cache = status['answer_cache']
+                print(f"💾 Answer cache: {answer_cache['exact_hits']} exact / {answer_cache['semantic_hits']} semantic hits, "
+                      f"{answer_cache['misses']} misses ({answer_cache['hit_rate']:.0%}), "
+                      f"~{answer_cache['time_saved']:.1f}s saved")
                 continue
             elif question.lower() == 'docs':
                 rag_system.list_documents()
                 continue
             elif question.lower() == 'scan':
-                new_docs = rag_system.scan_for_new_documents()
-                print(f"🔍 Found {new_docs} new documents")
+                rag_system.scan_for_new_documents()
+                changes = rag_system.kb_manager.last_scan_changes
+                print(f"🔍 Found {len(changes['added'])} new, {len(changes['modified'])} modified, "
+                      f"{len(changes['deleted'])} deleted documents")
                 continue
             elif question == '':
                 continue
             
-            # Ask the question
-            result = rag_system.ask_question(question)
+            # Ask the question, printing the answer as it is generated
+            stream = rag_system.ask_question_stream(question)
+            started = False
+            for chunk in stream:
+                if not started:
+                    print("\n🤖 Answer: ", end="", flush=True)
+                    started = True
+                print(chunk, end="", flush=True)
+            if started:
+                print()
+            result = stream.result
             
             if 'error' in result:
                 print(f"❌ Error: {result['error']}")
             else:
                 cached_indicator = "💾 (cached)" if result.get('cached', False) else "🆕 (new)"
-                print(f"\n🤖 Answer: {result['answer']}")
-                print(f"⏱️  Time: {result['execution_time']:.2f}s {cached_indicator}")
+                # No time_to_first_token when the LLM streamed nothing
+                first_token = result.get('time_to_first_token')
+                first_token = f", first token after {first_token:.2f}s" if first_token is not None else ""
+                print(f"⏱️  Time: {result['execution_time']:.2f}s{first_token} {cached_indicator}")
                 if result.get('source_files'):
                     print(f"📄 Sources: {', '.join(result['source_files'])}")
         
@@ -704,13 +4150,59 @@ if __name__ == "__main__":
         elif command == "interactive":
             rag = RAGSystem()
             interactive_mode(rag)
+        elif command == "batch" and len(sys.argv) > 2:
+            # Evaluation sets: batch questions.jsonl [results.jsonl]
+            rag = RAGSystem()
+            run_batch_file(rag, sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
+        elif command == "bench-embed":
+            # Offline throughput benchmark: bench-embed [chunks] [batch_size] [workers] [latency_s]
+            args = sys.argv[2:]
+            benchmark_embedding_pipeline(
+                num_chunks=int(args[0]) if len(args) > 0 else 2000,
+                batch_size=int(args[1]) if len(args) > 1 else EMBED_BATCH_SIZE,
+                max_workers=int(args[2]) if len(args) > 2 else EMBED_MAX_WORKERS,
+                latency=float(args[3]) if len(args) > 3 else 0.05
+            )
+        elif command == "bench-index":
+            # Recall/latency of index backends: bench-index [vectors] [dimensions]
+            args = sys.argv[2:]
+            benchmark_index_backends(
+                num_vectors=int(args[0]) if len(args) > 0 else 50000,
+                dimensions=int(args[1]) if len(args) > 1 else 256
+            )
+        elif command == "bench-splitter":
+            # Index size and recall of the character vs table-aware splitter: bench-splitter [files...]
+            benchmark_splitters(sys.argv[2:] or None)
+        elif command == "rebuild":
+            rag = RAGSystem()
+            rag.rebuild_index()
+            print("✅ Combined vector database rebuilt")
+        elif command == "compact":
+            rag = RAGSystem()
+            rag.compact_index()
+            print("✅ Combined vector database compacted")
+        elif command == "tables":
+            # tables [rebuild]: list (or first re-extract) the tables answered without the LLM
+            rag = RAGSystem()
+            if len(sys.argv) > 2 and sys.argv[2].lower() == "rebuild":
+                print(f"✅ Extracted tables from {rag.rebuild_tables()} documents")
+            for table in rag.kb_manager.table_store.list_tables(set(rag.kb_manager.documents)):
+                columns = ", ".join(f"{column['name']} ({column['type']})" for column in table['columns'])
+                print(f"📊 {table['doc_name']} | {table['table_name']} | {table['row_count']} rows | {columns}")
         else:
             print("Usage:")
             print("  python rag_pdf.py demo                    # Run demo")
             print("  python rag_pdf.py demo interactive        # Demo + interactive mode")
             print("  python rag_pdf.py interactive             # Interactive mode only")
             print("  python rag_pdf.py ask \"your question\"     # Ask single question")
+            print("  python rag_pdf.py batch questions.jsonl [results.jsonl]  # Answer a JSONL question set")
+            print("  python rag_pdf.py rebuild                 # Full rebuild of combined index")
+            print("  python rag_pdf.py compact                 # Fold appended deltas into combined index")
+            print("  python rag_pdf.py tables [rebuild]        # List (or re-extract) tables answered without the LLM")
+            print("  python rag_pdf.py bench-embed [n] [batch] [workers] [latency]  # Offline embedding benchmark")
+            print("  python rag_pdf.py bench-index [vectors] [dims]  # Recall/latency of index backends")
+            print("  python rag_pdf.py bench-splitter [files...]  # Index size/recall of character vs table-aware splitter")
     else:
         # Default: run demo
         rag = demo_usage()
-        interactive_mode(rag)
\ No newline at end of file
+        interactive_mode(rag)
\ No newline at end of file
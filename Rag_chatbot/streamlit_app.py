@@ -8,7 +8,8 @@ Streamlit RAG Chatbot with Enhanced Features
 
 import streamlit as st
 import os
-from rag_pdf import RAGSystem
+import itertools
+from rag_pdf import RAGSystem, RETRIEVAL_MODE
 import time
 
 # Page configuration
@@ -18,11 +19,17 @@ st.set_page_config(
     layout="wide"
 )
 
-# Initialize session state
-if 'rag_system' not in st.session_state:
-    with st.spinner("🚀 Initializing RAG System..."):
-        st.session_state.rag_system = RAGSystem()
-        st.session_state.chat_history = []
+@st.cache_resource(show_spinner="🚀 Initializing RAG System...")
+def get_rag_system() -> RAGSystem:
+    """One RAGSystem per server process, shared by every browser session"""
+    return RAGSystem()
+
+
+rag = get_rag_system()
+
+# Only the chat history is kept per session
+if 'chat_history' not in st.session_state:
+    st.session_state.chat_history = []
 
 # Title and description
 st.title("🤖 RAG Chatbot")
@@ -31,11 +38,18 @@ st.title("🤖 RAG Chatbot")
 with st.sidebar:
     st.header("📊 System Status")
     
-    rag = st.session_state.rag_system
     status = rag.get_status()
     
     st.metric("Total Documents", status['total_documents'])
     st.metric("Cached Answers", status['cache_size'])
+    query_cache = status['query_embedding_cache']
+    st.metric("Query Embedding Hit Rate", f"{query_cache['hit_rate']:.0%}",
+              help=f"{query_cache['memory_hits']} memory / {query_cache['disk_hits']} disk hits, "
+                   f"{query_cache['misses']} misses")
+    answer_cache = status['answer_cache']
+    st.metric("Answer Cache Hit Rate", f"{answer_cache['hit_rate']:.0%}",
+              help=f"{answer_cache['exact_hits']} exact / {answer_cache['semantic_hits']} semantic hits, "
+                   f"~{answer_cache['time_saved']:.1f}s of generation saved")
     
     st.divider()
     
@@ -43,12 +57,18 @@ with st.sidebar:
     use_cache = st.checkbox("Use Cache", value=True, help="Use cached answers for faster responses")
     k_results = st.slider("Search Results (k)", min_value=3, max_value=10, value=5, 
                          help="Number of relevant chunks to retrieve")
+    retrieval_modes = ["vector", "hybrid", "lexical"]
+    retrieval_mode = st.selectbox("Retrieval Mode", retrieval_modes,
+                                  index=retrieval_modes.index(RETRIEVAL_MODE),
+                                  help="Hybrid fuses vector and BM25 keyword search; lexical skips query embedding")
     
     if st.button("🔄 Scan for New Documents"):
         with st.spinner("Scanning..."):
-            new_docs = rag.scan_for_new_documents()
-            if new_docs > 0:
-                st.success(f"Found {new_docs} new documents!")
+            changed_docs = rag.scan_for_new_documents()
+            if changed_docs > 0:
+                changes = rag.kb_manager.last_scan_changes
+                st.success(f"Found {len(changes['added'])} new, {len(changes['modified'])} modified, "
+                           f"{len(changes['deleted'])} deleted documents!")
                 st.rerun()
             else:
                 st.info("No new documents found")
@@ -76,27 +96,37 @@ if prompt := st.chat_input("Ask a question about your documents..."):
     with st.chat_message("user"):
         st.write(prompt)
     
-    # Generate response
+    # Generate response, rendering tokens as they arrive
     with st.chat_message("assistant"):
+        start_time = time.time()
+        # The async pipeline shares one generation between identical concurrent questions
+        stream = rag.async_pipeline.stream(
+            prompt, 
+            use_cache=use_cache,
+            k=k_results,
+            mode=retrieval_mode
+        )
+        chunks = iter(stream)
         with st.spinner("🔍 Searching knowledge base..."):
-            start_time = time.time()
-            result = st.session_state.rag_system.ask_question(
-                prompt, 
-                use_cache=use_cache,
-                k=k_results
-            )
-            elapsed = time.time() - start_time
+            first_chunk = next(chunks, None)
+        if first_chunk is not None:
+            st.write_stream(itertools.chain([first_chunk], chunks))
+        result = stream.result
+        elapsed = time.time() - start_time
         
         if 'error' in result:
             st.error(f"Error: {result['error']}")
         else:
-            st.write(result['answer'])
-            
             # Show metadata
             col1, col2 = st.columns([2, 1])
             with col1:
-                if result.get('cached'):
+                if result.get('cache_match') == 'semantic':
+                    st.caption(f"💾 Cached response for a similar question: \"{result['cached_question']}\"")
+                elif result.get('cached'):
                     st.caption("💾 Cached response")
+                elif result.get('time_to_first_token') is not None:
+                    st.caption(f"🆕 Generated in {elapsed:.2f}s "
+                               f"(first token after {result['time_to_first_token']:.2f}s)")
                 else:
                     st.caption(f"🆕 Generated in {elapsed:.2f}s")
             